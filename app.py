@@ -1,15 +1,33 @@
+import logging
+import time
 import dash
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 from dash import dcc, html
-from scraper import scrape_market_cap_and_pe, scrape_roce_median, scrape_compounded_growth
+from fundamentals_store import export, get_fundamentals, get_growth_rates
 from dash import dash_table
-from pe_calc import calculate_intrinsic_value
+from pe_calc import dcf_schedule
+from pe_table import lookup_intrinsic_value, warm_table
+from reverse_dcf import market_pe, implied_growth, implied_growth_period
+from sensitivity import LABELS, sensitivity_analysis
+from monte_carlo import MC_PARAMS, MAX_PATHS, MIN_PATHS, PE_EDGES, default_distributions, start_monte_carlo_job
+from monte_carlo import monte_carlo_job_running, read_monte_carlo_job
+from watchlist import COLUMNS as WATCHLIST_COLUMNS, NUMERIC_COLUMNS as WATCHLIST_NUMERIC_COLUMNS
+from watchlist import parse_symbols, start_watchlist_job, read_watchlist_job
+from symbols import directory, record_view, start_prefetcher
 import plotly.graph_objs as go
+import metrics
+from metrics import timed
 
 external_stylesheets = ['https://fonts.googleapis.com/css2?family=Nunito+Sans&display=swap']
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 server = app.server
+metrics.install(server)  # /metrics for Prometheus, and the per-request profile header
+logger = logging.getLogger(__name__)
+if not export:  # A read-only deployment serves exported valuations and never scrapes ahead
+    warm_table()  # Build or map the precomputed intrinsic PE table without blocking startup
+    start_prefetcher()  # Keep the most-viewed symbols' fundamentals warm
 app.layout = html.Div([
 
     html.H1('Valuing Consistent Compounders', style={'font-family': 'Nunito Sans', 'font-size': '24px', 'color': 'gray'}),
@@ -17,9 +35,15 @@ app.layout = html.Div([
            'Compare this with current PE of the stock to calculate the degree of overvaluation.',
            style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
 
+    dcc.Store(id='fundamentals-store'),  # Scraped inputs for the selected symbol, read by the slider callback
+
     html.Div([
         html.Label('NSE/BSE Symbol:', style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
-        dcc.Input(id='symbol-input', type='text', value='NESTLEIND', style={'margin-bottom': '20px'}),
+        # Searchable picker: typing only queries the symbol directory, and the scraping callbacks run once a
+        # symbol is picked (or Enter is pressed) instead of on every keystroke
+        dcc.Dropdown(id='symbol-input', value='NESTLEIND', clearable=False, searchable=True,
+                     options=[{'label': 'NESTLEIND - Nestle India Limited', 'value': 'NESTLEIND'}],
+                     placeholder='Type a symbol or company name', style={'width': '400px', 'margin-bottom': '20px'}),
     ]),
 
     html.Div([
@@ -73,73 +97,235 @@ app.layout = html.Div([
         ])
     ]),
 
-    html.Div(id='intrinsic-output', style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'})
+    html.Div(id='intrinsic-output', style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+
+    html.Div([
+        html.H2('Cash flow schedule', style={'font-family': 'Nunito Sans', 'font-size': '18px', 'color': 'gray'}),
+        html.P('Year-by-year DCF behind the intrinsic PE, per 100 of starting capital.',
+               style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+        dcc.Graph(id='schedule-graph'),
+        dash_table.DataTable(
+            id='schedule-table',
+            columns=[{'name': 'Year', 'id': 'Year'}] +
+                    [{'name': name, 'id': name, 'type': 'numeric'}
+                     for name in ['NOPAT', 'Investment', 'FCF', 'Discount factor', 'Discounted FCF']],
+            data=[],
+            page_size=50,
+            style_table={'margin-top': '20px'}
+        ),
+    ], style={'margin-top': '40px'}),
+
+    html.Div([
+        html.H2('Sensitivity', style={'font-family': 'Nunito Sans', 'font-size': '18px', 'color': 'gray'}),
+        html.Label('Heatmap axes:', style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+        dcc.Dropdown(id='heatmap-x', options=[{'label': label, 'value': param} for param, label in LABELS.items()],
+                     value='coc', clearable=False, style={'width': '300px'}),
+        dcc.Dropdown(id='heatmap-y', options=[{'label': label, 'value': param} for param, label in LABELS.items()],
+                     value='growth', clearable=False, style={'width': '300px'}),
+        html.Div([
+            dcc.Graph(id='sensitivity-heatmap', style={'width': '48%', 'display': 'inline-block'}),
+            dcc.Graph(id='tornado-graph', style={'width': '48%', 'display': 'inline-block'})
+        ])
+    ], style={'margin-top': '40px'}),
+
+    html.Div([
+        html.H2('Monte Carlo valuation', style={'font-family': 'Nunito Sans', 'font-size': '18px', 'color': 'gray'}),
+        html.P('Each input is drawn from a normal distribution with the mean and standard deviation below. '
+               'Blank fields default to the scraped profit growth and 5-yr median RoCE, the CoC and terminal growth '
+               'sliders, and a fade period uniform over 5-20 years. The high growth period comes from its slider.',
+               style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+        html.Div([
+            html.Div([
+                html.Label(LABELS[param], style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+                dcc.Input(id=f'mc-{param}-mean', type='number', placeholder='mean'),
+                dcc.Input(id=f'mc-{param}-sd', type='number', placeholder='std dev', min=0),
+            ]) for param in MC_PARAMS
+        ]),
+        html.Label('Paths:', style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+        dcc.Input(id='mc-paths', type='number', value=100000, min=MIN_PATHS, max=MAX_PATHS, step=1000),
+        html.Button('Run Monte Carlo', id='mc-button', n_clicks=0),
+        html.Div(id='mc-stats', style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+        dcc.Graph(id='mc-histogram'),
+        dcc.Store(id='mc-job'),
+        dcc.Interval(id='mc-interval', interval=500, disabled=True),
+    ], style={'margin-top': '40px'}),
+
+    html.Div([
+        html.H2('Watchlist valuation', style={'font-family': 'Nunito Sans', 'font-size': '18px', 'color': 'gray'}),
+        html.Label('Symbols (comma or newline separated), valued with the slider parameters above:',
+                   style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+        dcc.Textarea(id='watchlist-input', style={'width': '100%', 'height': '80px'}),
+        html.Button('Value watchlist', id='watchlist-button', n_clicks=0),
+        html.Div(id='watchlist-stats', style={'font-family': 'Nunito Sans', 'font-size': '14px', 'color': 'gray'}),
+        dash_table.DataTable(
+            id='watchlist-table',
+            columns=[{'name': column, 'id': column, 'type': 'numeric' if column in WATCHLIST_NUMERIC_COLUMNS else 'text'}
+                     for column in WATCHLIST_COLUMNS],
+            data=[],
+            sort_action='native',
+            page_size=50,
+            style_table={'margin-top': '20px'}
+        ),
+        dcc.Store(id='watchlist-job'),
+        dcc.Interval(id='watchlist-interval', interval=1000, disabled=True),
+    ], style={'margin-top': '40px'})
 
 ])
 
 
 @app.callback(
-    [Output('intrinsic-output', 'children'),
+    [Output('fundamentals-store', 'data'),
      Output('stock-symbol', 'children'),
      Output('current-pe', 'children'),
      Output('fy23-pe', 'children'),
      Output('median-pre-tax-roce', 'children')],
-    [Input('symbol-input', 'value'),
+    [Input('symbol-input', 'value')]
+)
+@timed('callback.load_fundamentals')
+def load_fundamentals(symbol):
+    if symbol is None:  # If symbol is not provided, keep previous values
+        raise PreventUpdate
+
+    try:
+        fundamentals = get_fundamentals(symbol)  # Local store first, live scrape when it's missing or stale
+        current_pe = fundamentals['Stock P/E']
+        fy23_pe = fundamentals['FY23 P/E']
+        roce_data = fundamentals['ROCE Median']
+        as_of = time.strftime('%d %b %Y %H:%M', time.localtime(fundamentals['Fetched At']))
+
+        stock_symbol_output = f"Stock Symbol: {symbol} (data as of {as_of})"
+        current_pe_output = f"Current PE: {current_pe}"
+        fy23_pe_output = f"FY23 PE: {fy23_pe}"
+        median_pre_tax_roce_output = f"5-yr median tax pre-roce: {roce_data}"
+
+        record_view(symbol)
+        return fundamentals, stock_symbol_output, current_pe_output, fy23_pe_output, median_pre_tax_roce_output
+
+    except Exception as e:
+        logger.exception("Loading fundamentals for %s failed", symbol)
+        metrics.callback_errors.inc(callback='load_fundamentals')
+        return {'Error': f"An error occurred: {str(e)}"}, "", "", "", ""
+
+
+@app.callback(
+    Output('symbol-input', 'options'),
+    [Input('symbol-input', 'search_value')],
+    [State('symbol-input', 'value')]
+)
+@timed('callback.update_symbol_options')
+def update_symbol_options(search_value, value):
+    if not search_value:
+        raise PreventUpdate
+
+    options = [{'label': f"{symbol} - {name}", 'value': symbol} for symbol, name in directory.search(search_value)]
+    # Symbols missing from the directory can still be valued as typed, and the current pick must stay listed
+    typed = search_value.strip().upper()
+    for symbol in (typed, value):
+        if symbol and all(option['value'] != symbol for option in options):
+            options.append({'label': symbol, 'value': symbol})
+    return options
+
+
+@app.callback(
+    Output('intrinsic-output', 'children'),
+    [Input('fundamentals-store', 'data'),
      Input('coc-slider', 'value'),
      Input('roce-slider', 'value'),
      Input('growth-slider', 'value'),
      Input('high-growth-period-slider', 'value'),
      Input('fade-period-slider', 'value'),
-     Input('terminal-growth-slider', 'value')],
-    [State('intrinsic-output', 'children'),
-     State('stock-symbol', 'children'),
-     State('current-pe', 'children'),
-     State('fy23-pe', 'children'),
-     State('median-pre-tax-roce', 'children')]
+     Input('terminal-growth-slider', 'value')]
 )
-def update_intrinsic(symbol, coc, roce, growth, high_growth_period, fade_period, terminal_growth,
-                     intrinsic_output_prev, stock_symbol_prev, current_pe_prev, fy23_pe_prev, median_pre_tax_roce_prev):
-    if symbol is None:  # If symbol is not provided, return previous values
-        return intrinsic_output_prev, stock_symbol_prev, current_pe_prev, fy23_pe_prev, median_pre_tax_roce_prev
+@timed('callback.update_intrinsic')
+def update_intrinsic(fundamentals, coc, roce, growth, high_growth_period, fade_period, terminal_growth):
+    # Runs on every slider move, so it only reads the stored fundamentals and never scrapes
+    if fundamentals is None:
+        raise PreventUpdate
+    if 'Error' in fundamentals:
+        return html.Div(fundamentals['Error'])
 
     try:
-        scrap = scrape_market_cap_and_pe(symbol)
-        if scrap is None or 'Stock P/E' not in scrap or 'FY23 P/E' not in scrap:
-            raise ValueError("Invalid scraping result")
-
-        current_pe = scrap['Stock P/E']
-        fy23_pe = scrap['FY23 P/E']
-
-        roce_data = scrape_roce_median(symbol)  # Ensure this function is defined to fetch ROCE data
-        if roce_data is None:
-            raise ValueError("Invalid ROCE scraping result")
-
-        intrinsic_pe, overeval = calculate_intrinsic_value(roce, coc, growth, high_growth_period, fade_period,
-                                                           terminal_growth, scrap)
-
-        intrinsic_pe_output = html.Div([
+        target_pe = market_pe(fundamentals)
+        valuation = fundamentals.get('Valuation')  # Precomputed at the default sliders by the export job
+        params = {'coc': coc, 'roce': roce, 'growth': growth, 'high_growth_period': high_growth_period,
+                  'fade_period': fade_period, 'terminal_growth': terminal_growth}
+        if valuation and valuation['params'] == params:
+            intrinsic_pe, overeval = valuation['intrinsic_pe'], valuation['overvaluation']
+            growth_needed, years_needed = valuation['implied_growth'], valuation['implied_growth_period']
+        else:
+            intrinsic_pe, overeval = lookup_intrinsic_value(roce, coc, growth, high_growth_period, fade_period,
+                                                            terminal_growth, fundamentals)
+
+            # Reverse DCF: what the market PE implies, holding the other sliders fixed
+            growth_needed = implied_growth(target_pe, roce, coc, high_growth_period, fade_period, terminal_growth)
+            years_needed = implied_growth_period(target_pe, roce, coc, growth, fade_period, terminal_growth)
+
+        return html.Div([
             html.P(f"The Calculated Intrinsic PE: {round(intrinsic_pe, 2)}"),
-            html.P(f"Degree of overvaluation: {round(overeval * 100)}%")
+            html.P(f"Degree of overvaluation: {round(overeval * 100)}%"),
+            html.P(f"Growth implied by PE of {target_pe}: "
+                   f"{round(growth_needed, 1) if growth_needed is not None else 'n/a'}% "
+                   f"for {high_growth_period} years"),
+            html.P(f"High growth period implied at {growth}% growth: "
+                   f"{round(years_needed, 1) if years_needed is not None else 'n/a'} years")
         ])
 
-        stock_symbol_output = f"Stock Symbol: {symbol}"
-        current_pe_output = f"Current PE: {current_pe}"
-        fy23_pe_output = f"FY23 PE: {fy23_pe}"
-        median_pre_tax_roce_output = f"5-yr median tax pre-roce: {roce_data}"
+    except Exception as e:
+        logger.exception("Valuing %s failed", fundamentals.get('Symbol'))
+        metrics.callback_errors.inc(callback='update_intrinsic')
+        return html.Div(f"An error occurred: {str(e)}")
 
-        return intrinsic_pe_output, stock_symbol_output, current_pe_output, fy23_pe_output, median_pre_tax_roce_output
 
-    except Exception as e:
-        error_message = f"An error occurred: {str(e)}"
-        return html.Div(error_message), "", "", "", ""
+@app.callback(
+    [Output('schedule-graph', 'figure'),
+     Output('schedule-table', 'data')],
+    [Input('coc-slider', 'value'),
+     Input('roce-slider', 'value'),
+     Input('growth-slider', 'value'),
+     Input('high-growth-period-slider', 'value'),
+     Input('fade-period-slider', 'value'),
+     Input('terminal-growth-slider', 'value')]
+)
+@timed('callback.update_schedule')
+def update_schedule(coc, roce, growth, high_growth_period, fade_period, terminal_growth):
+    # The growth years come from pe_calc's cache on most slider moves, so this is mostly formatting
+    schedule = dcf_schedule(roce, coc, growth, high_growth_period, fade_period, terminal_growth)
+
+    rows = [{'Year': year, 'NOPAT': round(nopat, 2), 'Investment': round(investment, 2), 'FCF': round(fcf, 2),
+             'Discount factor': round(factor, 4), 'Discounted FCF': round(discounted, 2)}
+            for year, nopat, investment, fcf, factor, discounted in
+            zip(schedule['year'], schedule['nopat'], schedule['investment'], schedule['fcf'],
+                schedule['discount_factor'], schedule['discounted_fcf'])]
+    terminal = schedule['terminal']
+    rows.append({'Year': 'Terminal', 'NOPAT': round(terminal['nopat'], 2),
+                 'Investment': round(terminal['investment'], 2), 'FCF': round(terminal['fcf'], 2),
+                 'Discount factor': round(terminal['discount_factor'], 4),
+                 'Discounted FCF': round(terminal['discounted_fcf'], 2)})
+
+    figure = {
+        'data': [
+            go.Bar(x=schedule['year'], y=schedule['fcf'], name='FCF'),
+            go.Bar(x=schedule['year'], y=schedule['discounted_fcf'], name='Discounted FCF'),
+            go.Scatter(x=schedule['year'], y=schedule['nopat'], name='NOPAT', mode='lines')
+        ],
+        'layout': go.Layout(
+            title=f"Cash flows (intrinsic PE {round(schedule['intrinsic_pe'], 2)})",
+            xaxis=dict(title='Year'),
+            yaxis=dict(title='Per 100 of starting capital'),
+            plot_bgcolor='white',
+            paper_bgcolor='white'
+        )
+    }
+    return figure, rows
 
 
 @app.callback(
     Output('growth-table-container', 'children'),
     [Input('symbol-input', 'value')]
 )
+@timed('callback.update_growth_table')
 def update_growth_table(symbol):
-    sales_growth_rates, profit_growth_rates = scrape_compounded_growth(symbol)
+    sales_growth_rates, profit_growth_rates = get_growth_rates(symbol)
 
     if sales_growth_rates is not None and profit_growth_rates is not None:
         # Remove percentage signs from the data
@@ -171,8 +357,9 @@ def update_growth_table(symbol):
     Output('sales-growth-graph', 'figure'),
     [Input('symbol-input', 'value')]
 )
+@timed('callback.update_sales_graph')
 def update_sales_graph(symbol):
-    sales_growth_rates, _ = scrape_compounded_growth(symbol)
+    sales_growth_rates, _ = get_growth_rates(symbol)
     if sales_growth_rates:
         # Convert growth rates to float and remove percentage signs
         sales_growth_rates = [float(rate.replace('%', '')) for rate in sales_growth_rates]
@@ -200,8 +387,9 @@ def update_sales_graph(symbol):
     Output('profit-growth-graph', 'figure'),
     [Input('symbol-input', 'value')]
 )
+@timed('callback.update_profit_graph')
 def update_profit_graph(symbol):
-    _, profit_growth_rates = scrape_compounded_growth(symbol)
+    _, profit_growth_rates = get_growth_rates(symbol)
     if profit_growth_rates:
         # Convert growth rates to float and remove percentage signs
         profit_growth_rates = [float(rate.replace('%', '')) for rate in profit_growth_rates]
@@ -225,8 +413,198 @@ def update_profit_graph(symbol):
     return {}
 
 
+@app.callback(
+    [Output('sensitivity-heatmap', 'figure'),
+     Output('tornado-graph', 'figure')],
+    [Input('fundamentals-store', 'data'),
+     Input('coc-slider', 'value'),
+     Input('roce-slider', 'value'),
+     Input('growth-slider', 'value'),
+     Input('high-growth-period-slider', 'value'),
+     Input('fade-period-slider', 'value'),
+     Input('terminal-growth-slider', 'value'),
+     Input('heatmap-x', 'value'),
+     Input('heatmap-y', 'value')]
+)
+@timed('callback.update_sensitivity')
+def update_sensitivity(fundamentals, coc, roce, growth, high_growth_period, fade_period, terminal_growth,
+                       x_param, y_param):
+    if fundamentals is None or 'Error' in fundamentals or x_param == y_param:
+        return {}, {}
+
+    params = {'coc': coc, 'roce': roce, 'growth': growth, 'high_growth_period': high_growth_period,
+              'fade_period': fade_period, 'terminal_growth': terminal_growth}
+    analysis = sensitivity_analysis(params, fundamentals, x_param, y_param)
+
+    heatmap = {
+        'data': [go.Heatmap(
+            x=analysis['x'],
+            y=analysis['y'],
+            z=analysis['intrinsic_pe'].round(2),
+            colorscale='Viridis',
+            colorbar=dict(title='Intrinsic PE')
+        )],
+        'layout': go.Layout(
+            title='Intrinsic PE',
+            xaxis=dict(title=LABELS[x_param]),
+            yaxis=dict(title=LABELS[y_param]),
+            plot_bgcolor='white',
+            paper_bgcolor='white'
+        )
+    }
+
+    # Bars are drawn from the base case out to the overvaluation at each slider extreme
+    bars = analysis['tornado']
+    base = analysis['base_overvaluation'] * 100
+    labels = [LABELS[bar['param']] for bar in bars]
+    tornado = {
+        'data': [
+            go.Bar(y=labels, x=[bar['low'] * 100 - base for bar in bars], base=base, orientation='h',
+                   name='Slider minimum', text=[bar['low_value'] for bar in bars]),
+            go.Bar(y=labels, x=[bar['high'] * 100 - base for bar in bars], base=base, orientation='h',
+                   name='Slider maximum', text=[bar['high_value'] for bar in bars])
+        ],
+        'layout': go.Layout(
+            title='Overvaluation (%) at each slider extreme',
+            barmode='overlay',
+            xaxis=dict(title='Degree of overvaluation (%)'),
+            plot_bgcolor='white',
+            paper_bgcolor='white'
+        )
+    }
+    return heatmap, tornado
+
+
+@app.callback(
+    Output('mc-job', 'data'),
+    [Input('mc-button', 'n_clicks')],
+    [State('mc-job', 'data'),
+     State('fundamentals-store', 'data'),
+     State('mc-paths', 'value'),
+     State('coc-slider', 'value'),
+     State('roce-slider', 'value'),
+     State('growth-slider', 'value'),
+     State('high-growth-period-slider', 'value'),
+     State('fade-period-slider', 'value'),
+     State('terminal-growth-slider', 'value')] +
+    [State(f'mc-{param}-{field}', 'value') for param in MC_PARAMS for field in ('mean', 'sd')]
+)
+@timed('callback.start_monte_carlo')
+def start_monte_carlo(n_clicks, job_id, fundamentals, paths, coc, roce, growth, high_growth_period, fade_period,
+                      terminal_growth, *overrides):
+    if not n_clicks or fundamentals is None or 'Error' in fundamentals:
+        raise PreventUpdate
+    if job_id is not None and monte_carlo_job_running(job_id):
+        raise PreventUpdate  # One run at a time; the running one keeps updating the histogram
+
+    params = {'coc': coc, 'roce': roce, 'growth': growth, 'high_growth_period': high_growth_period,
+              'fade_period': fade_period, 'terminal_growth': terminal_growth}
+    distributions = default_distributions(fundamentals, params)
+    for i, param in enumerate(MC_PARAMS):
+        mean, sd = overrides[2 * i], overrides[2 * i + 1]
+        if mean is not None:
+            distributions[param] = {'kind': 'normal', 'mean': mean, 'sd': sd or 0.0}
+
+    return start_monte_carlo_job(distributions, high_growth_period, fundamentals, paths or 100000)
+
+
+@app.callback(
+    [Output('mc-histogram', 'figure'),
+     Output('mc-stats', 'children'),
+     Output('mc-interval', 'disabled')],
+    [Input('mc-job', 'data'),
+     Input('mc-interval', 'n_intervals')]
+)
+@timed('callback.update_monte_carlo')
+def update_monte_carlo(job_id, n_intervals):
+    # Polls the running job, so the histogram and percentiles fill in chunk by chunk
+    if job_id is None:
+        raise PreventUpdate
+
+    summary = read_monte_carlo_job(job_id)
+    if summary.get('error'):
+        return {}, f"The Monte Carlo run failed: {summary['error']}", True
+    if not summary['paths']:
+        return {}, "Starting...", False
+
+    def fmt(value):
+        if value is None:
+            return f"<{PE_EDGES[0]:g}"
+        return f"{value:.2f}" if value < PE_EDGES[-1] else f">{PE_EDGES[-1]:g}"
+
+    # Only the bins that have paths are drawn; there are none when every PE falls outside the edges
+    counts = summary['counts']
+    used = [i for i, count in enumerate(counts) if count]
+    bars = []
+    if used:
+        first, last = used[0], used[-1] + 1
+        centres = [(PE_EDGES[i] * PE_EDGES[i + 1]) ** 0.5 for i in range(first, last)]
+        bars.append(go.Bar(x=centres, y=counts[first:last], width=[PE_EDGES[i + 1] - PE_EDGES[i]
+                                                                   for i in range(first, last)]))
+    figure = {
+        'data': bars,
+        'layout': go.Layout(
+            title='Intrinsic PE distribution',
+            xaxis=dict(title='Intrinsic PE'),
+            yaxis=dict(title='Paths'),
+            plot_bgcolor='white',
+            paper_bgcolor='white'
+        )
+    }
+    stats_output = html.Div([
+        html.P(f"{summary['paths']}/{summary['total_paths']} paths, {summary['below']} with an intrinsic PE below "
+               f"{PE_EDGES[0]:g} and {summary['above']} above {PE_EDGES[-1]:g} (not charted)"),
+        html.P(f"Intrinsic PE P5: {fmt(summary['p5'])}, P50: {fmt(summary['p50'])}, P95: {fmt(summary['p95'])}"),
+        html.P(f"Probability of overvaluation: {round(summary['prob_overvalued'] * 100, 1)}%")
+    ])
+    return figure, stats_output, summary['finished']
+
+
+@app.callback(
+    Output('watchlist-job', 'data'),
+    [Input('watchlist-button', 'n_clicks')],
+    [State('watchlist-input', 'value'),
+     State('coc-slider', 'value'),
+     State('roce-slider', 'value'),
+     State('growth-slider', 'value'),
+     State('high-growth-period-slider', 'value'),
+     State('fade-period-slider', 'value'),
+     State('terminal-growth-slider', 'value')]
+)
+@timed('callback.start_watchlist')
+def start_watchlist(n_clicks, text, coc, roce, growth, high_growth_period, fade_period, terminal_growth):
+    symbols = parse_symbols(text)
+    if not n_clicks or not symbols:
+        raise PreventUpdate
+
+    params = {'coc': coc, 'roce': roce, 'growth': growth, 'high_growth_period': high_growth_period,
+              'fade_period': fade_period, 'terminal_growth': terminal_growth}
+    return start_watchlist_job(symbols, params)
+
+
+@app.callback(
+    [Output('watchlist-table', 'data'),
+     Output('watchlist-stats', 'children'),
+     Output('watchlist-interval', 'disabled')],
+    [Input('watchlist-job', 'data'),
+     Input('watchlist-interval', 'n_intervals')]
+)
+@timed('callback.update_watchlist')
+def update_watchlist(job_id, n_intervals):
+    # Polls the job's CSV while it runs, so rows show up as each symbol completes
+    if job_id is None:
+        raise PreventUpdate
+
+    rows, stats = read_watchlist_job(job_id)
+    stats_output = (f"{stats['done']}/{stats['total']} symbols, {stats['failures']} failed, "
+                    f"{stats['symbols_per_second']} symbols/sec, {stats['cache_hits']} cache hits")
+    return rows, stats_output, stats['finished']
+
+
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     try:
         app.run_server(debug=True)
-    except Exception as e:
-        pass  # Handle the exception silently
+    except Exception:
+        logger.exception("Dash server stopped")
+        raise SystemExit(1)
@@ -0,0 +1,268 @@
+"""
+Regression checks and benchmarks for the DCF engine, the scraper parsing and the Dash callbacks.
+
+    python benchmark.py                        # everything; results are appended to benchmark_history.jsonl
+    python benchmark.py dcf parsing            # only some groups (dcf, batch, parsing, callbacks)
+    python benchmark.py --fail-on-regression   # also exit 1 if anything is 25% slower than the last run
+
+Every faster path is checked against fixtures/golden.json, which holds the outputs of the original
+list-based calculate_intrinsic_value and the original html.parser scrapers; a mismatch exits with status 1.
+The network is replaced by stub_server.py serving fixtures/, and the fundamentals store, shared cache and
+rate limiter are turned off so every run measures the same work.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+from stub_server import start_stub_server
+
+stub = start_stub_server()
+os.environ['REVERSEDCF_SCREENER_URL'] = stub.base_url
+os.environ['REVERSEDCF_STORE_DB'] = ''
+os.environ['REVERSEDCF_RATE_LIMIT'] = '0'
+os.environ.pop('REVERSEDCF_CACHE_DB', None)
+
+import numpy as np  # noqa: E402
+from bs4 import BeautifulSoup  # noqa: E402
+
+import scraper  # noqa: E402
+from scraper import parse_company_page, parse_html  # noqa: E402
+from pe_calc import calculate_intrinsic_value, intrinsic_pe_batch, growth_phase, cash_flows, \
+    discount_factors  # noqa: E402
+from pe_table import get_table, lookup_intrinsic_value  # noqa: E402
+from reverse_dcf import implied_growth, implied_growth_batch  # noqa: E402
+from sensitivity import sensitivity_analysis  # noqa: E402
+from monte_carlo import default_distributions, run_monte_carlo  # noqa: E402
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(ROOT, 'fixtures')
+HISTORY_PATH = os.path.join(ROOT, 'benchmark_history.jsonl')
+REGRESSION_THRESHOLD = 1.25
+DEFAULT_PARAMS = {'coc': 10, 'roce': 30, 'growth': 12, 'high_growth_period': 10, 'fade_period': 5,
+                  'terminal_growth': 2}
+
+with open(os.path.join(FIXTURES_DIR, 'golden.json')) as f:
+    GOLDEN = json.load(f)
+
+
+def timeit(func, repeat=20):
+    """Best-of-repeat wall time of func() in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def check_close(name, actual, expected, rel_tol=1e-9):
+    if not math.isclose(actual, expected, rel_tol=rel_tol, abs_tol=1e-12):
+        raise AssertionError(f"{name}: got {actual!r}, golden {expected!r}")
+
+
+def load_fixtures():
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))):
+        with open(path, 'rb') as f:
+            fixtures[os.path.basename(path)] = f.read()
+    return fixtures
+
+
+def bench_dcf():
+    """Scalar DCF and the table lookup over golden points sampled from the whole slider domain."""
+    scrap = GOLDEN['scrap']
+    points = GOLDEN['dcf']
+
+    get_table()  # Build or map the table outside the timings
+    for point in points:
+        for name, func in (('calculate_intrinsic_value', calculate_intrinsic_value),
+                           ('lookup_intrinsic_value', lookup_intrinsic_value)):
+            intrinsic_pe, overeval = func(*point['args'], scrap)
+            check_close(f"{name}{tuple(point['args'])}", intrinsic_pe, point['intrinsic_pe'])
+            check_close(f"{name}{tuple(point['args'])} overvaluation", overeval, point['overvaluation'])
+
+    def scalar_domain():
+        for point in points:
+            calculate_intrinsic_value(*point['args'], scrap)
+
+    def lookup_domain():
+        for point in points:
+            lookup_intrinsic_value(*point['args'], scrap)
+
+    def scalar_cold():
+        for cache in (growth_phase, cash_flows, discount_factors):
+            cache.cache_clear()
+        calculate_intrinsic_value(30, 10, 12, 10, 5, 2, scrap)
+
+    return {
+        'dcf.scalar_cold_ms': timeit(scalar_cold, 200),
+        'dcf.scalar_default_ms': timeit(lambda: calculate_intrinsic_value(30, 10, 12, 10, 5, 2, scrap), 200),
+        'dcf.scalar_per_point_ms': timeit(scalar_domain, 5) / len(points),
+        'dcf.table_lookup_per_point_ms': timeit(lookup_domain, 5) / len(points),
+    }
+
+
+def bench_batch():
+    """Vectorized paths: the batch engine, reverse solvers, sensitivity and Monte Carlo."""
+    scrap = GOLDEN['scrap']
+    args = np.array([point['args'] for point in GOLDEN['dcf']]).T
+    expected = np.array([point['intrinsic_pe'] for point in GOLDEN['dcf']])
+
+    batch = intrinsic_pe_batch(*args)
+    worst = np.max(np.abs(batch - expected) / np.abs(expected))
+    if worst > 1e-9:
+        raise AssertionError(f"intrinsic_pe_batch: max relative error {worst:.2e} against golden")
+
+    # The solvers must recover the growth each golden PE was computed with (positive PEs only)
+    positive = expected > 0
+    solved = implied_growth_batch(expected[positive], args[0][positive], args[1][positive], args[3][positive],
+                                  args[4][positive], args[5][positive])
+    worst = np.nanmax(np.abs(solved - args[2][positive]))
+    if worst > 1e-4 or np.isnan(solved).any():
+        raise AssertionError(f"implied_growth_batch: max error {worst:.2e} pp against golden growth")
+    check_close('implied_growth', implied_growth(expected[0], 30, 10, 10, 5, 2), 12, rel_tol=1e-6)
+
+    fundamentals = {**scrap, 'ROCE Median': 116.0, 'Profit Growth': ['11%', '17%', '13%', '31%']}
+    distributions = default_distributions(fundamentals, DEFAULT_PARAMS)
+
+    def monte_carlo():
+        for _ in run_monte_carlo(distributions, 10, scrap, paths=100000, seed=0):
+            pass
+
+    return {
+        'batch.golden_points_ms': timeit(lambda: intrinsic_pe_batch(*args)),
+        'batch.implied_growth_per_case_ms': timeit(lambda: implied_growth(expected[0], 30, 10, 10, 5, 2)),
+        'batch.implied_growth_batch_ms': timeit(lambda: implied_growth_batch(
+            expected[positive], args[0][positive], args[1][positive], args[3][positive], args[4][positive],
+            args[5][positive]), 5),
+        'batch.sensitivity_17x13_ms': timeit(lambda: sensitivity_analysis(DEFAULT_PARAMS, scrap)),
+        'batch.monte_carlo_100k_ms': timeit(monte_carlo, 3),
+    }
+
+
+def bench_parsing():
+    """Full-tree against sliced parsing of each fixture, then each scrape_* function against golden values."""
+    results = {}
+    for name, content in load_fixtures().items():
+        full = parse_company_page(BeautifulSoup(content, 'html.parser'))
+        sliced = parse_company_page(parse_html(content))
+        if full != sliced:
+            raise AssertionError(f"{name}: sliced parse differs from the full parse")
+        if name == 'NESTLEIND.consolidated.html':
+            results['parsing.full_tree_ms'] = timeit(lambda: parse_company_page(BeautifulSoup(content, 'html.parser')))
+            results['parsing.sliced_ms'] = timeit(lambda: parse_company_page(parse_html(content)))
+
+    for symbol, golden in GOLDEN['scrape'].items():
+        for name, expected in golden.items():
+            scraper.snapshot_cache.clear()
+            actual = getattr(scraper, name)(symbol)
+            if isinstance(actual, tuple):
+                actual = list(actual)
+            if actual != expected:
+                raise AssertionError(f"{name}({symbol!r}): got {actual!r}, golden {expected!r}")
+
+    def cold(name):
+        def run():
+            scraper.snapshot_cache.clear()
+            getattr(scraper, name)('NESTLEIND')
+        return run
+
+    for name in ('scrape_market_cap_and_pe', 'scrape_roce_median', 'scrape_compounded_growth'):
+        results[f'parsing.{name}_cold_ms'] = timeit(cold(name), 10)
+    return results
+
+
+def bench_callbacks():
+    """End-to-end Dash callback latency against the stub server, with a cold and a warm snapshot cache."""
+    import app
+
+    def load_cold():
+        scraper.snapshot_cache.clear()
+        return app.load_fundamentals('NESTLEIND')
+
+    fundamentals = load_cold()[0]
+    golden = GOLDEN['scrape']['NESTLEIND']
+    for key, value in golden['scrape_market_cap_and_pe'].items():
+        if fundamentals[key] != value:
+            raise AssertionError(f"load_fundamentals: {key} is {fundamentals[key]!r}, golden {value!r}")
+
+    def growth_cold():
+        scraper.snapshot_cache.clear()
+        app.update_growth_table('NESTLEIND')
+
+    return {
+        'callbacks.load_fundamentals_cold_ms': timeit(load_cold, 10),
+        'callbacks.load_fundamentals_warm_ms': timeit(lambda: app.load_fundamentals('NESTLEIND')),
+        'callbacks.update_intrinsic_ms': timeit(lambda: app.update_intrinsic(fundamentals, 10, 30, 12, 10, 5, 2)),
+        'callbacks.update_schedule_ms': timeit(lambda: app.update_schedule(10, 30, 12, 10, 5, 2)),
+        'callbacks.update_growth_table_cold_ms': timeit(growth_cold, 10),
+        'callbacks.update_growth_table_warm_ms': timeit(lambda: app.update_growth_table('NESTLEIND')),
+    }
+
+
+GROUPS = {'dcf': bench_dcf, 'batch': bench_batch, 'parsing': bench_parsing, 'callbacks': bench_callbacks}
+
+
+def last_run(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Golden-value checks and benchmarks')
+    parser.add_argument('groups', nargs='*', help=f"groups to run: {', '.join(GROUPS)} (default: all)")
+    parser.add_argument('--history', default=HISTORY_PATH, help='JSON-lines file the results are appended to')
+    parser.add_argument('--no-record', action='store_true', help="don't append this run to the history")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+    unknown = set(args.groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+
+    results = {}
+    try:
+        for name in args.groups or GROUPS:
+            results.update(GROUPS[name]())
+    except AssertionError as e:
+        print(f"GOLDEN CHECK FAILED: {e}")
+        sys.exit(1)
+
+    previous = last_run(args.history)
+    regressions = []
+    for key, value in results.items():
+        before = previous['results'].get(key) if previous else None
+        change = f" (was {before:.3f}, {value / before:.2f}x)" if before else ""
+        if before and value > before * REGRESSION_THRESHOLD:
+            regressions.append(key)
+            change += "  <-- slower"
+        print(f"{key}: {value:.3f}{change}")
+
+    if not args.no_record:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+                                'python': sys.version.split()[0], 'results': results}) + '\n')
+
+    print(f"All golden checks passed; {len(regressions)} timing(s) more than "
+          f"{round((REGRESSION_THRESHOLD - 1) * 100)}% slower than the last recorded run.")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No cross-worker locks on Windows; coalescing stays within each process
+
+QUOTE_TTL = 5 * 60  # Market cap and P/E move with the price
+ANNUAL_TTL = 24 * 60 * 60  # Annual P&L, ROCE and growth tables change at most daily
+MAX_STALE = 7 * 24 * 60 * 60  # Older entries are reloaded before being served
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    At most one call per key in flight. Callers arriving while a call for their key is running wait for it
+    and share its result (or exception) instead of making their own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> Call in flight
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.stats['calls'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SnapshotCache:
+    """
+    Bounded LRU cache of company snapshots with stale-while-revalidate.
+
+    Callers pass the TTL of the fields they read. A fresh entry is returned as is; an entry older than the TTL
+    is still returned immediately while a background thread reloads it. If db_path is set, snapshots are also
+    written to a SQLite file so every gunicorn worker shares what any one of them fetched.
+
+    Concurrent loads of one symbol are coalesced: within a worker through SingleFlight, and with db_path and
+    worker_locks set, across workers through a lock file per symbol next to the SQLite file.
+    """
+
+    def __init__(self, loader, decode, max_entries=256, db_path=None, max_stale=MAX_STALE, worker_locks=True):
+        self.loader = loader  # symbol -> snapshot with fetched_at, has_data() and to_dict()
+        self.decode = decode  # to_dict() output -> snapshot, for entries read back from SQLite
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.max_stale = max_stale
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()  # sqlite3 connections can't be shared between threads
+        self.refreshing = set()
+        self.flight = SingleFlight()
+        self.lock_dir = f'{db_path}.locks' if db_path and worker_locks and fcntl else None
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'disk_hits': 0, 'refreshes': 0, 'errors': 0,
+                      'fallbacks': 0, 'worker_coalesced': 0}
+
+        if db_path:
+            conn = self.connect()
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS snapshots '
+                             '(symbol TEXT PRIMARY KEY, fetched_at REAL, data TEXT)')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.db_path, timeout=5)
+        return conn
+
+    def count(self, event):
+        with self.lock:  # Callbacks run on many threads; a bare += would lose updates
+            self.stats[event] += 1
+
+    def get(self, symbol, ttl=ANNUAL_TTL):
+        now = time.time()
+        with self.lock:
+            snapshot = self.entries.get(symbol)
+            if snapshot is not None:
+                self.entries.move_to_end(symbol)
+
+        if snapshot is None or now - snapshot.fetched_at > ttl:
+            # Another worker may already have fetched a newer copy
+            stored = self.read_disk(symbol)
+            if stored is not None and (snapshot is None or stored.fetched_at > snapshot.fetched_at):
+                self.count('disk_hits')
+                self.remember(symbol, stored)
+                snapshot = stored
+
+        if snapshot is None or now - snapshot.fetched_at > self.max_stale:
+            self.count('misses')
+            loaded = self.load(symbol)
+            if not loaded.has_data() and snapshot is not None:
+                self.count('fallbacks')
+                return snapshot  # The upstream is failing: a very old copy beats no data
+            return loaded
+
+        if now - snapshot.fetched_at > ttl:
+            self.count('stale')
+            self.refresh_in_background(symbol)
+        else:
+            self.count('hits')
+        return snapshot
+
+    def load(self, symbol):
+        return self.flight.do(symbol, lambda: self.load_across_workers(symbol))
+
+    def load_across_workers(self, symbol):
+        if not self.lock_dir:
+            return self.fetch(symbol)
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        lock_path = os.path.join(self.lock_dir, hashlib.sha1(symbol.encode()).hexdigest()[:16] + '.lock')
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is loading this symbol: wait for it, then use what it wrote if it succeeded
+                before = self.read_disk(symbol)
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                stored = self.read_disk(symbol)
+                if stored is not None and (before is None or stored.fetched_at > before.fetched_at):
+                    self.count('worker_coalesced')
+                    self.remember(symbol, stored)
+                    return stored
+            try:
+                return self.fetch(symbol)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def fetch(self, symbol):
+        snapshot = self.loader(symbol)
+        if snapshot.has_data():  # Failed fetches are not cached
+            self.remember(symbol, snapshot)
+            self.write_disk(symbol, snapshot)
+        return snapshot
+
+    def refresh_in_background(self, symbol):
+        with self.lock:
+            if symbol in self.refreshing:
+                return
+            self.refreshing.add(symbol)
+
+        def refresh():
+            try:
+                self.load(symbol)
+                self.count('refreshes')
+            except Exception:
+                self.count('errors')  # Keep serving the stale copy
+                logger.warning("Background refresh of %s failed", symbol, exc_info=True)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(symbol)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def remember(self, symbol, snapshot):
+        with self.lock:
+            self.entries[symbol] = snapshot
+            self.entries.move_to_end(symbol)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def read_disk(self, symbol):
+        if not self.db_path:
+            return None
+        row = self.connect().execute('SELECT data FROM snapshots WHERE symbol = ?', (symbol,)).fetchone()
+        if row is None:
+            return None
+        return self.decode(json.loads(row[0]))
+
+    def write_disk(self, symbol, snapshot):
+        if not self.db_path:
+            return
+        conn = self.connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO snapshots (symbol, fetched_at, data) VALUES (?, ?, ?)',
+                         (symbol, snapshot.fetched_at, json.dumps(snapshot.to_dict())))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        with self.lock:
+            stats = dict(self.stats)
+            entries = len(self.entries)
+        lookups = stats['hits'] + stats['stale'] + stats['misses']
+        served = stats['hits'] + stats['stale']
+        return {**stats, 'entries': entries, 'hit_ratio': served / lookups if lookups else 0.0}
+
+
+def cache_from_env(loader, decode):
+    return SnapshotCache(loader, decode,
+                         max_entries=int(os.environ.get('REVERSEDCF_CACHE_SIZE', 256)),
+                         db_path=os.environ.get('REVERSEDCF_CACHE_DB'),
+                         worker_locks=os.environ.get('REVERSEDCF_COALESCE_WORKERS', '1') == '1')
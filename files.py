@@ -0,0 +1,47 @@
+"""
+File helpers shared across the app: atomic writes, and the directory where background jobs (watchlists and
+Monte Carlo runs) leave their progress for any gunicorn worker on the host to read.
+"""
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+JOBS_DIR = os.environ.get('REVERSEDCF_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'reversedcf_jobs'))
+JOB_MAX_AGE = float(os.environ.get('REVERSEDCF_JOB_MAX_AGE', 24 * 60 * 60))  # Seconds since a job file last changed
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path to write in place of path. It is renamed over path once the block finishes, so
+    readers in any process see the old file or the complete new one, never half of it.
+    """
+    partial_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        yield partial_path
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)  # The block failed
+
+
+def write_json(path, data, **kwargs):
+    with atomic_path(path) as partial_path:
+        with open(partial_path, 'w') as f:
+            json.dump(data, f, **kwargs)
+
+
+def job_dir():
+    """JOBS_DIR, created if needed, after removing the files of jobs that finished more than JOB_MAX_AGE ago."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    cutoff = time.time() - JOB_MAX_AGE
+    for entry in os.scandir(JOBS_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass  # Another worker removed it first
+    return JOBS_DIR
@@ -0,0 +1,394 @@
+"""
+Local SQLite store of scraped fundamentals, so page views don't depend on screener.in being up and fast.
+
+One row per symbol holds the latest quote and the values the DCF needs; the Net Profit and ROCE % histories
+and the compounded growth ranges are kept in long (symbol, year, value) tables keyed for indexed lookups.
+Every row records when it was fetched. Keep the store current with the refresh job, which only re-fetches
+symbols older than --max-age:
+
+    python fundamentals_store.py refresh symbols.txt --max-age 86400
+    python fundamentals_store.py refresh --all --max-age 3600
+
+For a read-only deployment, the export job writes one compact JSON snapshot per symbol (fundamentals, history,
+growth tables and the valuation at the default slider settings) plus an index.json, and optionally a Parquet
+table. With REVERSEDCF_EXPORT pointing at that directory, or at the URL of a static host serving it, the app
+serves exported symbols from their snapshots however old they are (unless REVERSEDCF_EXPORT_MAX_AGE is set)
+and only scrapes symbols that aren't exported:
+
+    python fundamentals_store.py export symbols.txt --out snapshots/ --parquet snapshots/snapshots.parquet
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+
+from cache import ANNUAL_TTL, QUOTE_TTL
+from files import write_json
+from pe_calc import calculate_intrinsic_value
+from reverse_dcf import market_pe, implied_growth, implied_growth_period
+from scraper import load_snapshot, get_snapshot, scrape_market_cap_and_pe, scrape_roce_median, \
+    scrape_compounded_growth, scrape_history, breaker
+
+STORE_PATH = os.environ.get('REVERSEDCF_STORE_DB', os.path.join(tempfile.gettempdir(), 'reversedcf_fundamentals.db'))
+STORE_MAX_AGE = float(os.environ.get('REVERSEDCF_STORE_MAX_AGE', ANNUAL_TTL))  # Older rows trigger a live scrape
+QUOTE_MAX_AGE = float(os.environ.get('REVERSEDCF_QUOTE_MAX_AGE', QUOTE_TTL))  # Older market cap and P/E are re-read
+EXPORT_LOCATION = os.environ.get('REVERSEDCF_EXPORT')  # Directory or base URL of an export, unset to disable
+EXPORT_MAX_AGE = float(os.environ.get('REVERSEDCF_EXPORT_MAX_AGE', 0))  # Older snapshots are re-scraped, 0 never
+EXPORT_RELOAD = 300  # Seconds an exported snapshot (or its absence) is kept in memory before re-reading
+SAFE_SYMBOL = re.compile(r'[A-Za-z0-9&_-]+')  # Symbols become file names and URL paths
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS companies (
+    symbol TEXT PRIMARY KEY,
+    market_cap REAL,
+    stock_pe REAL,
+    fy23_pe REAL,
+    net_profit REAL,
+    roce_median REAL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS net_profit (
+    symbol TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    year TEXT,
+    value REAL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (symbol, position)
+);
+CREATE TABLE IF NOT EXISTS roce (
+    symbol TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    year TEXT,
+    value REAL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (symbol, position)
+);
+CREATE TABLE IF NOT EXISTS growth (
+    symbol TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value TEXT,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (symbol, metric, position)
+);
+CREATE INDEX IF NOT EXISTS companies_fetched_at ON companies (fetched_at);
+'''
+
+
+class FundamentalsStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.local = threading.local()  # sqlite3 connections can't be shared between threads
+        self.connect().executescript(SCHEMA)
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')  # Readers in other workers don't block the refresh job
+        return conn
+
+    def write(self, fundamentals, history):
+        """Replace a symbol's rows with the output of extract_fundamentals() and scrape_history()."""
+        symbol = fundamentals['Symbol']
+        fetched_at = fundamentals['Fetched At']
+
+        conn = self.connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO companies VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (symbol, fundamentals['Market Cap'], fundamentals['Stock P/E'], fundamentals['FY23 P/E'],
+                          fundamentals['Net Profit'], fundamentals['ROCE Median'], fetched_at))
+            for table, key in (('net_profit', 'Net Profit'), ('roce', 'ROCE %')):
+                conn.execute(f'DELETE FROM {table} WHERE symbol = ?', (symbol,))
+                conn.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?)',
+                                 [(symbol, i, year, value, fetched_at) for i, (year, value) in
+                                  enumerate(history[key])])
+            conn.execute('DELETE FROM growth WHERE symbol = ?', (symbol,))
+            for metric in ('Sales Growth', 'Profit Growth'):
+                conn.executemany('INSERT INTO growth VALUES (?, ?, ?, ?, ?)',
+                                 [(symbol, metric, i, rate, fetched_at) for i, rate in
+                                  enumerate(fundamentals[metric] or [])])
+
+    def read(self, symbol):
+        """The same dict as extract_fundamentals(), or None if the symbol isn't stored."""
+        conn = self.connect()
+        row = conn.execute('SELECT market_cap, stock_pe, fy23_pe, net_profit, roce_median, fetched_at '
+                           'FROM companies WHERE symbol = ?', (symbol,)).fetchone()
+        if row is None:
+            return None
+
+        growth = {'Sales Growth': [], 'Profit Growth': []}
+        for metric, value in conn.execute('SELECT metric, value FROM growth WHERE symbol = ? ORDER BY metric, position',
+                                          (symbol,)):
+            growth[metric].append(value)
+
+        return {'Symbol': symbol, 'Market Cap': row[0], 'Stock P/E': row[1], 'FY23 P/E': row[2],
+                'Net Profit': row[3], 'ROCE Median': row[4], 'Fetched At': row[5],
+                'Sales Growth': growth['Sales Growth'] or None, 'Profit Growth': growth['Profit Growth'] or None}
+
+    def symbols(self):
+        return [row[0] for row in self.connect().execute('SELECT symbol FROM companies ORDER BY symbol')]
+
+    def stale_symbols(self, symbols, max_age):
+        cutoff = time.time() - max_age
+        conn = self.connect()
+        fresh = {row[0] for row in conn.execute('SELECT symbol FROM companies WHERE fetched_at >= ?', (cutoff,))}
+        return [symbol for symbol in symbols if symbol not in fresh]
+
+
+store = FundamentalsStore() if STORE_PATH else None  # REVERSEDCF_STORE_DB='' turns the store off
+
+
+class SnapshotExport:
+    """
+    Read side of an export: <location>/<SYMBOL>.json from a local directory or over HTTP, cached in memory.
+    read() returns the same dict as FundamentalsStore.read(), plus the precomputed 'Valuation'.
+    """
+
+    def __init__(self, location, reload_after=EXPORT_RELOAD):
+        self.location = location.rstrip('/')
+        self.remote = location.startswith(('http://', 'https://'))
+        self.reload_after = reload_after
+        self.loaded = {}  # symbol -> (loaded at, snapshot or None)
+        self.lock = threading.Lock()
+
+    def snapshot(self, symbol):
+        if not SAFE_SYMBOL.fullmatch(symbol or ''):
+            return None
+        with self.lock:
+            loaded_at, snapshot = self.loaded.get(symbol, (0, None))
+        if time.time() - loaded_at > self.reload_after:
+            snapshot = self.load(symbol)
+            with self.lock:
+                self.loaded[symbol] = (time.time(), snapshot)
+        return snapshot
+
+    def load(self, symbol):
+        try:
+            if self.remote:
+                response = requests.get(f'{self.location}/{quote(symbol)}.json', timeout=(3.05, 5))
+                return response.json() if response.status_code == 200 else None
+            with open(os.path.join(self.location, f'{symbol}.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, requests.RequestException):
+            logger.warning("Reading the exported snapshot of %s failed", symbol, exc_info=True)
+            return None
+
+    def read(self, symbol):
+        snapshot = self.snapshot(symbol)
+        return {**snapshot['fundamentals'], 'Valuation': snapshot['valuation']} if snapshot else None
+
+
+export = SnapshotExport(EXPORT_LOCATION) if EXPORT_LOCATION else None
+
+
+def extract_fundamentals(symbol, snapshot):
+    scrap = scrape_market_cap_and_pe(symbol, snapshot)
+    if scrap is None and breaker.state != breaker.CLOSED:
+        raise ValueError("screener.in is not responding, please try again in a minute")
+    if scrap is None or 'Stock P/E' not in scrap or 'FY23 P/E' not in scrap:
+        raise ValueError("Invalid scraping result")
+
+    roce_data = scrape_roce_median(symbol, snapshot)
+    if roce_data is None:
+        raise ValueError("Invalid ROCE scraping result")
+
+    growth_rates = scrape_compounded_growth(symbol, snapshot)
+    return {'Symbol': symbol, **scrap, 'ROCE Median': roce_data, 'Fetched At': snapshot.fetched_at,
+            'Sales Growth': growth_rates[0] if growth_rates else None,
+            'Profit Growth': growth_rates[1] if growth_rates else None}
+
+
+def is_fresh(stored, max_age):
+    return stored is not None and time.time() - stored['Fetched At'] <= max_age
+
+
+def read_export(symbol):
+    # The exported copy, while it is current enough to be served
+    exported = export.read(symbol) if export else None
+    return exported if exported is not None and (not EXPORT_MAX_AGE or is_fresh(exported, EXPORT_MAX_AGE)) else None
+
+
+def get_fundamentals(symbol, max_age=QUOTE_MAX_AGE):
+    """
+    Fundamentals for the app. An exported snapshot is served whatever its age unless EXPORT_MAX_AGE is set:
+    a read-only deployment is as current as its last export. Market cap and P/E move with the price, so a
+    stored row is only served while it is younger than max_age (QUOTE_TTL by default). Otherwise the symbol
+    is read through the snapshot cache, which only goes upstream when its own copy is that old too, and
+    written through to the store. If the live scrape fails, an old row is still better than nothing.
+    """
+    exported = read_export(symbol)
+    if exported is not None:
+        return exported
+
+    stored = store.read(symbol) if store else None
+    if is_fresh(stored, max_age):
+        return stored
+
+    try:
+        snapshot = get_snapshot(symbol, max_age)
+        fundamentals = extract_fundamentals(symbol, snapshot)
+    except Exception:
+        # Including an export past EXPORT_MAX_AGE, which still beats no data
+        copies = [copy for copy in (stored, export.read(symbol) if export else None) if copy is not None]
+        if copies:
+            stored = max(copies, key=lambda copy: copy['Fetched At'])
+            logger.warning("Live scrape of %s failed, serving data from %s", symbol,
+                           time.strftime('%Y-%m-%d %H:%M', time.localtime(stored['Fetched At'])), exc_info=True)
+            return stored
+        raise
+
+    if stored is not None and stored['Fetched At'] >= fundamentals['Fetched At']:
+        return stored  # The cache served a stale snapshot while it reloads, and the refresh job has a newer row
+    if store:
+        store.write(fundamentals, scrape_history(symbol, snapshot))
+    return fundamentals
+
+
+def get_growth_rates(symbol, max_age=STORE_MAX_AGE):
+    # Same (sales, profit) result as scrape_compounded_growth, from the export or the store when they have them
+    exported = read_export(symbol)
+    if exported is not None and exported['Sales Growth'] is not None:
+        return exported['Sales Growth'], exported['Profit Growth']
+    stored = store.read(symbol) if store else None
+    if is_fresh(stored, max_age) and stored['Sales Growth'] is not None:
+        return stored['Sales Growth'], stored['Profit Growth']
+
+    growth_rates = scrape_compounded_growth(symbol)
+    if growth_rates is None:  # Also when screener.in is failing: old ranges beat none
+        for copy in (stored, export.read(symbol) if export else None):
+            if copy is not None and copy['Sales Growth'] is not None:
+                return copy['Sales Growth'], copy['Profit Growth']
+    return growth_rates
+
+
+def refresh(symbols, max_age, workers=8):
+    """
+    Re-fetch the symbols whose rows are older than max_age. Returns the refreshed symbols and {symbol: error}
+    for the ones that failed.
+    """
+    if store is None:
+        raise RuntimeError("The fundamentals store is turned off (REVERSEDCF_STORE_DB is empty)")
+    stale = store.stale_symbols(symbols, max_age)
+
+    def refresh_symbol(symbol):
+        try:
+            snapshot = load_snapshot(symbol)  # Bypass the cache: we want fresh pages
+            store.write(extract_fundamentals(symbol, snapshot), scrape_history(symbol, snapshot))
+            return symbol, None
+        except Exception as e:
+            return symbol, str(e) or type(e).__name__
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(refresh_symbol, stale))
+    return ([symbol for symbol, error in results if error is None],
+            {symbol: error for symbol, error in results if error is not None})
+
+
+def export_symbol(symbol, params):
+    """One symbol's export snapshot, scraped fresh and valued at params."""
+    snapshot = load_snapshot(symbol)  # Bypass the cache: we want fresh pages
+    fundamentals = extract_fundamentals(symbol, snapshot)
+
+    intrinsic_pe, overeval = calculate_intrinsic_value(params['roce'], params['coc'], params['growth'],
+                                                       params['high_growth_period'], params['fade_period'],
+                                                       params['terminal_growth'], fundamentals)
+    target_pe = market_pe(fundamentals)
+    growth_needed = implied_growth(target_pe, params['roce'], params['coc'], params['high_growth_period'],
+                                   params['fade_period'], params['terminal_growth'])
+    years_needed = implied_growth_period(target_pe, params['roce'], params['coc'], params['growth'],
+                                         params['fade_period'], params['terminal_growth'])
+    return {'fundamentals': fundamentals, 'history': scrape_history(symbol, snapshot),
+            'valuation': {'params': params, 'intrinsic_pe': intrinsic_pe, 'overvaluation': overeval,
+                          'implied_growth': growth_needed, 'implied_growth_period': years_needed}}
+
+
+def export_snapshots(symbols, out_dir, params, parquet_path=None, workers=4):
+    """
+    Write <out_dir>/<SYMBOL>.json for every symbol and an index.json listing them. A symbol that fails keeps
+    the file from the previous export, if any. Returns the exported symbols and {symbol: error} for the rest.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    def export_one(symbol):
+        if not SAFE_SYMBOL.fullmatch(symbol):
+            return symbol, None, "Unsupported symbol"
+        try:
+            data = export_symbol(symbol, params)
+        except Exception as e:
+            return symbol, None, str(e) or type(e).__name__
+        write_json(os.path.join(out_dir, f'{symbol}.json'), data, separators=(',', ':'))
+        return symbol, data, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(export_one, symbols))
+    exported = {symbol: data for symbol, data, _ in results if data is not None}
+    failed = {symbol: error for symbol, _, error in results if error is not None}
+    write_json(os.path.join(out_dir, 'index.json'), {'built_at': time.time(), 'params': params,
+                                                      'symbols': list(exported), 'failed': failed},
+               separators=(',', ':'))
+
+    if parquet_path:
+        from watchlist import write_parquet
+        write_parquet([{**data['fundamentals'], 'Intrinsic PE': data['valuation']['intrinsic_pe'],
+                        'Overvaluation %': data['valuation']['overvaluation'] * 100,
+                        'Implied Growth %': data['valuation']['implied_growth']} for data in exported.values()],
+                      parquet_path)
+    return list(exported), failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the local fundamentals store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = subparsers.add_parser('refresh', help='re-fetch symbols whose data is stale')
+    refresh_parser.add_argument('symbols', nargs='?', help='file with symbols, comma or newline separated')
+    refresh_parser.add_argument('--all', action='store_true', help='refresh every symbol already in the store')
+    refresh_parser.add_argument('--max-age', type=float, default=STORE_MAX_AGE, help='seconds')
+    refresh_parser.add_argument('--workers', type=int, default=8)
+    export_parser = subparsers.add_parser('export', help='write static JSON snapshots for the app to serve')
+    export_parser.add_argument('symbols', help='file with symbols, comma or newline separated')
+    export_parser.add_argument('--out', required=True, help='directory for the snapshots')
+    export_parser.add_argument('--parquet', help='also write all snapshots to this Parquet file (needs pyarrow)')
+    export_parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == 'refresh' and store is None:
+        parser.error("the fundamentals store is turned off (REVERSEDCF_STORE_DB is empty)")
+
+    from watchlist import DEFAULT_PARAMS, parse_symbols
+    symbols = store.symbols() if args.command == 'refresh' and args.all else []
+    if args.symbols:
+        with open(args.symbols) as f:
+            symbols += parse_symbols(f.read())
+    symbols = list(dict.fromkeys(symbols))
+
+    start = time.perf_counter()
+    if args.command == 'export':
+        exported, failed = export_snapshots(symbols, args.out, DEFAULT_PARAMS, args.parquet, args.workers)
+        print(f"{len(exported)} exported, {len(failed)} failed in {time.perf_counter() - start:.1f}s")
+        for symbol, error in failed.items():
+            print(f"{symbol}: {error}")
+        return
+
+    refreshed, failed = refresh(symbols, args.max_age, args.workers)
+    print(f"{len(refreshed)} refreshed, {len(failed)} failed, {len(symbols) - len(refreshed) - len(failed)} "
+          f"already fresh in {time.perf_counter() - start:.1f}s")
+    for symbol, error in failed.items():
+        print(f"{symbol}: {error}")
+
+
+if __name__ == '__main__':
+    main()
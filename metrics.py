@@ -0,0 +1,197 @@
+"""
+Request-path metrics in the Prometheus text format, served on /metrics by app.py.
+
+Stages (upstream fetches, each parse function, the DCF and every Dash callback) are timed with @timed and
+land in one latency histogram labelled by stage. Metrics live in the worker's memory, so with several gunicorn
+workers each scrape of /metrics sees the worker that answered it; Prometheus sums them per instance.
+
+With REVERSEDCF_PROFILE_DIR set, a request sent with the X-ReverseDCF-Profile header is run under cProfile
+and dumped to that directory, and its per-stage timings come back in a Server-Timing header.
+"""
+import contextvars
+import cProfile
+import functools
+import logging
+import os
+import threading
+import time
+import uuid
+
+from flask import Response, g, request
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_HEADER = 'X-ReverseDCF-Profile'
+PROFILE_DIR = os.environ.get('REVERSEDCF_PROFILE_DIR')  # Unset: the profile header is ignored
+
+logger = logging.getLogger(__name__)
+registry = []
+request_timings = contextvars.ContextVar('request_timings', default=None)  # (stage, seconds) for a profiled request
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, format_labels(self.labels, key), value) for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        i = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    samples.append((f'{self.name}_bucket', format_labels(self.labels, key, f'le="{bound}"'),
+                                    cumulative))
+                samples.append((f'{self.name}_sum', format_labels(self.labels, key), series[-1]))
+                samples.append((f'{self.name}_count', format_labels(self.labels, key), cumulative))
+        return samples
+
+
+class Collected:
+    """A metric read from elsewhere when /metrics is scraped: collect() returns {label values: value}."""
+
+    def __init__(self, name, help, kind, collect, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.collect = collect
+        self.labels = labels
+        registry.append(self)
+
+    def samples(self):
+        return [(self.name, format_labels(self.labels, key), value) for key, value in sorted(self.collect().items())]
+
+
+stage_seconds = Histogram('reversedcf_stage_seconds', 'Time spent in each stage of serving a request',
+                          labels=('stage',))
+upstream_responses = Counter('reversedcf_upstream_responses_total',
+                             'Responses from screener.in by status code ("error" for timeouts and connection errors)',
+                             labels=('status',))
+page_reads = Counter('reversedcf_page_reads_total',
+                     'Company pages read by the views; standalone reads are fallbacks from the consolidated page',
+                     labels=('page',))
+upstream_retries = Counter('reversedcf_upstream_retries_total', 'Upstream requests retried after a 429, 5xx or error')
+callback_errors = Counter('reversedcf_callback_errors_total', 'Exceptions caught in Dash callbacks',
+                          labels=('callback',))
+
+
+def observe(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def timed(stage):
+    """Decorator recording the wall time of every call into stage_seconds, exceptions included."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def start_profile():
+    if not PROFILE_DIR or not request.headers.get(PROFILE_HEADER):
+        return
+
+    g.timings_token = request_timings.set([])
+    g.profiler = cProfile.Profile()
+    try:
+        g.profiler.enable()
+    except ValueError:  # Another request in this process is already being profiled
+        g.profiler = None
+
+
+def finish_profile(response):
+    token = g.pop('timings_token', None)
+    if token is None:
+        return response
+
+    profiler = g.pop('profiler', None)
+    timings = request_timings.get()
+    request_timings.reset(token)
+
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    response.headers['Server-Timing'] = ', '.join(f'{stage};dur={seconds * 1000:.2f}'
+                                                  for stage, seconds in totals.items())
+
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof")
+        profiler.dump_stats(path)
+        response.headers[PROFILE_HEADER] = os.path.basename(path)
+        logger.info("Wrote request profile %s", path)
+    return response
+
+
+def install(server):
+    """Add the /metrics route and the profiling hooks to a Flask server."""
+    server.add_url_rule('/metrics', 'metrics', lambda: Response(render(), mimetype='text/plain; version=0.0.4'))
+    server.before_request(start_profile)
+    server.after_request(finish_profile)
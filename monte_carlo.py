@@ -0,0 +1,169 @@
+"""
+Monte Carlo valuation: draw growth, RoCE, CoC, fade period and terminal growth from distributions and report
+the distribution of intrinsic PE instead of a single point estimate.
+
+Paths are evaluated in fixed-size chunks with intrinsic_pe_batch and folded into a fixed log-spaced histogram,
+so memory stays the same for any number of paths and percentiles can be reported after every chunk.
+"""
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from pe_calc import intrinsic_pe_batch
+from reverse_dcf import market_pe
+from files import JOBS_DIR, job_dir, write_json
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+PE_EDGES = np.geomspace(0.1, 10000, 1001)  # Histogram bins; PEs below 0.1 (or negative) are counted apart
+MC_PARAMS = ['growth', 'roce', 'coc', 'fade_period', 'terminal_growth']
+MIN_PATHS, MAX_PATHS = 1000, 1000000  # A run from the page is clamped to this range
+ABANDONED_AFTER = 60  # Seconds without a new chunk before an unfinished job counts as dead (worker restart)
+
+
+def default_distributions(fundamentals, params):
+    """
+    Distributions centred on the scraped data where there is some: growth on the compounded profit growth
+    figures, RoCE on the 5-yr median. CoC and terminal growth are centred on the sliders.
+    """
+    profit_growth = [float(rate.replace('%', '')) for rate in (fundamentals.get('Profit Growth') or [])[:3]
+                     if rate.replace('%', '').strip()]
+    if profit_growth:
+        growth = {'kind': 'normal', 'mean': statistics.median(profit_growth),
+                  'sd': max(statistics.pstdev(profit_growth), 1.0)}
+    else:
+        growth = {'kind': 'normal', 'mean': params['growth'], 'sd': 2.0}
+
+    roce_median = fundamentals.get('ROCE Median') or params['roce']
+    return {
+        'growth': growth,
+        'roce': {'kind': 'normal', 'mean': roce_median, 'sd': 0.15 * roce_median},
+        'coc': {'kind': 'normal', 'mean': params['coc'], 'sd': 1.0},
+        'fade_period': {'kind': 'uniform', 'low': 5, 'high': 20},
+        'terminal_growth': {'kind': 'normal', 'mean': params['terminal_growth'], 'sd': 0.75},
+    }
+
+
+def sample(spec, size, rng):
+    if spec['kind'] == 'normal':
+        return rng.normal(spec['mean'], spec['sd'], size)
+    if spec['kind'] == 'uniform':
+        return rng.uniform(spec['low'], spec['high'], size)
+    if spec['kind'] == 'triangular':
+        return rng.triangular(spec['low'], spec['mode'], spec['high'], size)
+    if spec['kind'] == 'fixed':
+        return np.full(size, float(spec['value']))
+    raise ValueError(f"Unknown distribution: {spec['kind']}")
+
+
+def sample_paths(distributions, size, rng):
+    draws = {name: sample(distributions[name], size, rng) for name in MC_PARAMS}
+
+    # Keep every path inside the model's domain
+    draws['roce'] = np.maximum(draws['roce'], 1.0)
+    draws['terminal_growth'] = np.maximum(draws['terminal_growth'], 0.0)
+    draws['coc'] = np.maximum(draws['coc'], draws['terminal_growth'] + 0.5)
+    draws['growth'] = np.maximum(draws['growth'], draws['terminal_growth'])
+    draws['fade_period'] = np.maximum(np.rint(draws['fade_period']), 1).astype(int)
+    return draws
+
+
+def percentile(counts, below, above, q):
+    """
+    Approximate percentile from the histogram, interpolating geometrically inside the bin.
+    None if it falls below the first bin edge and inf if it falls above the last.
+    """
+    total = below + counts.sum() + above
+    rank = q / 100 * total
+    if rank <= below:
+        return None  # Falls among the PEs below the first bin edge
+    cumulative = below + np.cumsum(counts)
+    i = int(np.searchsorted(cumulative, rank))
+    if i == len(counts):
+        return float('inf')  # Falls among the PEs above the last bin edge
+    before = cumulative[i - 1] if i else below
+    fraction = (rank - before) / counts[i] if counts[i] else 0.0
+    return float(PE_EDGES[i] * (PE_EDGES[i + 1] / PE_EDGES[i]) ** fraction)
+
+
+def run_monte_carlo(distributions, high_growth_period, scrap, paths=100000, seed=None, chunk_size=CHUNK_SIZE):
+    """Yield a summary of all paths so far after every chunk; the last one covers the full run."""
+    rng = np.random.default_rng(seed)
+    target_pe = market_pe(scrap)
+    counts = np.zeros(len(PE_EDGES) - 1, dtype=np.int64)
+    below = above = overvalued = done = 0
+
+    while done < paths:
+        size = min(chunk_size, paths - done)
+        draws = sample_paths(distributions, size, rng)
+        intrinsic_pe = intrinsic_pe_batch(draws['roce'], draws['coc'], draws['growth'], high_growth_period,
+                                          draws['fade_period'], draws['terminal_growth'])
+
+        counts += np.histogram(intrinsic_pe, PE_EDGES)[0]
+        below += int(np.count_nonzero(intrinsic_pe < PE_EDGES[0]))
+        above += int(np.count_nonzero(intrinsic_pe >= PE_EDGES[-1]))
+        overvalued += int(np.count_nonzero(intrinsic_pe < target_pe))
+        done += size
+
+        yield {'paths': done, 'total_paths': paths,
+               'p5': percentile(counts, below, above, 5), 'p50': percentile(counts, below, above, 50),
+               'p95': percentile(counts, below, above, 95), 'prob_overvalued': overvalued / done,
+               'below': below, 'above': above, 'counts': counts}
+
+
+def start_monte_carlo_job(distributions, high_growth_period, scrap, paths=100000, seed=None):
+    """
+    Run in a background thread, writing the latest summary to <job>.mc.json under JOBS_DIR after each chunk.
+    paths is clamped to MIN_PATHS..MAX_PATHS.
+    """
+    paths = min(max(int(paths), MIN_PATHS), MAX_PATHS)
+    job_id = uuid.uuid4().hex
+    path = os.path.join(job_dir(), f'{job_id}.mc.json')  # job_dir() also clears out old jobs
+
+    def write(summary, finished, error=None):
+        write_json(path, {**summary, 'counts': summary['counts'].tolist(), 'finished': finished, 'error': error})
+
+    def run():
+        summary = initial
+        try:
+            for summary in run_monte_carlo(distributions, high_growth_period, scrap, paths, seed):
+                write(summary, finished=False)
+        except Exception as e:
+            # Finish the job with the error, so the page shows it and a new run can start
+            logger.exception("Monte Carlo job %s failed", job_id)
+            write(summary, finished=True, error=str(e))
+            return
+        write(summary, finished=True)
+
+    initial = {'paths': 0, 'total_paths': paths, 'p5': None, 'p50': None, 'p95': None, 'prob_overvalued': None,
+               'below': 0, 'above': 0, 'counts': np.zeros(len(PE_EDGES) - 1, dtype=np.int64)}
+    write(initial, finished=False)
+    threading.Thread(target=run, daemon=True).start()
+    return job_id
+
+
+def read_monte_carlo_job(job_id):
+    """The latest summary of a job; raises FileNotFoundError once its file has been cleaned up."""
+    with open(os.path.join(JOBS_DIR, f'{job_id}.mc.json')) as f:
+        return json.load(f)
+
+
+def monte_carlo_job_running(job_id):
+    """
+    Whether the job is still running. A job whose file has gone, or that has not written a chunk for
+    ABANDONED_AFTER seconds because its worker was restarted, counts as finished.
+    """
+    path = os.path.join(JOBS_DIR, f'{job_id}.mc.json')
+    try:
+        updated = os.path.getmtime(path)
+        finished = read_monte_carlo_job(job_id)['finished']
+    except FileNotFoundError:
+        return False
+    return not finished and time.time() - updated < ABANDONED_AFTER
@@ -1,64 +1,164 @@
-def calculate_intrinsic_value(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth, scrap):
-    roc_pre_tax = roc_pre_tax / 100  # RoCE
-    coc = coc / 100  # Cost of Capital
-    initial_egv = initial_egv / 100  # Initial earnings growth rate
-    growth_year = growth_year  # Initial growth years
-    fade_period = fade_period  # The period after which the earnings growth starts to fade
-    terminal_growth = terminal_growth / 100  # Terminal growth rate, assumed for the calculation
-
-    tax_rate = 0.25  # Tax rate, derived from RoC post-tax formula
-    roc_post_tax = roc_pre_tax * (1 - tax_rate)  # RoC post-tax
+import functools
+
+import numpy as np
+
+from metrics import timed
+
+TAX_RATE = 0.25  # Tax rate, derived from RoC post-tax formula
+
+
+def intrinsic_pe_batch(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth):
+    """
+    Vectorized growth-RoCE DCF. Takes the slider values (percentages and years) as scalars or arrays,
+    broadcasts them against each other and returns an array of intrinsic PE, one per parameter set.
+    Every case is stepped through the longest horizon in the batch; years past a case's own
+    growth_year + fade_period are masked out.
+    """
+    roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth = np.broadcast_arrays(
+        np.asarray(roc_pre_tax, dtype=float) / 100,  # RoCE
+        np.asarray(coc, dtype=float) / 100,  # Cost of Capital
+        np.asarray(initial_egv, dtype=float) / 100,  # Initial earnings growth rate
+        np.asarray(growth_year, dtype=int),  # Initial growth years
+        np.asarray(fade_period, dtype=int),  # The period after which the earnings growth starts to fade
+        np.asarray(terminal_growth, dtype=float) / 100)  # Terminal growth rate, assumed for the calculation
+
+    roc_post_tax = roc_pre_tax * (1 - TAX_RATE)  # RoC post-tax
     reinvestment_rate_1 = initial_egv / roc_post_tax  # Reinvestment rate before fade period
     reinvestment_rate_2 = terminal_growth / roc_post_tax  # Reinvestment rate after fade period
     decline = (initial_egv - terminal_growth) / fade_period
+    horizon = growth_year + fade_period
 
     initial_nopat = 100 * roc_post_tax
     initial_investment = initial_nopat * reinvestment_rate_1
-    initial_capital_ending = 100 + initial_investment
+    capital_ending = 100 + initial_investment
+    intrinsic_value = initial_nopat - initial_investment  # Year 0 FCF, discount factor 1
+    earning_growth_rate = initial_egv
+    nopat = initial_nopat
 
-    years = list(range(0, growth_year + fade_period + 1))
-    nopats = [initial_nopat]
-    ebts = [initial_nopat / (1 - tax_rate)]
-    investments = [initial_investment]
-    fcfs = [initial_nopat - initial_investment]
-    discount_factors = [1 / (1 + coc) ** n for n in years]
-    discounted_fcfs = [fcfs[0] * discount_factors[0]]
-    capital_endings = [initial_capital_ending]
-    earning_growth_rates = [initial_egv]
+    for n in range(1, int(horizon.max(initial=0)) + 1):
+        active = n <= horizon
+        in_growth = n <= growth_year
 
-    for n in range(1, len(years)):
-        current_growth_rate = earning_growth_rates[n - 1] - decline if n > growth_year else initial_egv
-        current_growth_rate = max(current_growth_rate, terminal_growth)
-        earning_growth_rates.append(current_growth_rate)
+        earning_growth_rate = np.maximum(np.where(in_growth, initial_egv, earning_growth_rate - decline),
+                                         terminal_growth)
+        year_nopat = capital_ending * roc_post_tax
+        investment_rate = np.where(in_growth, reinvestment_rate_1, earning_growth_rate / roc_post_tax)
+        investment = year_nopat * investment_rate
+        discounted_fcf = (year_nopat - investment) * (1 / (1 + coc) ** n)
 
-        nopat = capital_endings[n - 1] * roc_post_tax
-        nopats.append(nopat)
+        intrinsic_value = intrinsic_value + np.where(active, discounted_fcf, 0)
+        nopat = np.where(active, year_nopat, nopat)
+        capital_ending = np.where(active, capital_ending + investment, capital_ending)
 
-        ebt = nopat / (1 - tax_rate)
-        ebts.append(ebt)
+    terminal_nopat = nopat * (1 + terminal_growth) / (coc - terminal_growth)
+    terminal_investment = terminal_nopat * reinvestment_rate_2
+    terminal_fcf = terminal_nopat - terminal_investment
+    terminal_discounted_fcf = terminal_fcf * (1 / (1 + coc) ** horizon)
 
-        investment_rate = reinvestment_rate_1 if n <= growth_year else earning_growth_rates[n] / roc_post_tax
-        investment = nopat * investment_rate
-        investments.append(investment)
+    intrinsic_value = intrinsic_value + terminal_discounted_fcf
+    return intrinsic_value / initial_nopat
 
-        fcf = nopat - investment
-        fcfs.append(fcf)
 
-        discounted_fcf = fcf * discount_factors[n]
-        discounted_fcfs.append(discounted_fcf)
+@functools.lru_cache(maxsize=1024)
+def growth_phase(roc_pre_tax, initial_egv, growth_year):
+    """
+    Undiscounted (nopat, investment, fcf) for years 0..growth_year, and the capital at the end of that year.
+    Only RoCE, growth and the high growth period shape these years, so moving the CoC, fade period or
+    terminal growth sliders reuses them.
+    """
+    roc_post_tax = roc_pre_tax / 100 * (1 - TAX_RATE)
+    reinvestment_rate_1 = initial_egv / 100 / roc_post_tax  # Reinvestment rate before fade period
 
-        capital_ending = capital_endings[n - 1] + investment
-        capital_endings.append(capital_ending)
+    nopat = 100 * roc_post_tax
+    investment = nopat * reinvestment_rate_1
+    capital_ending = 100 + investment
+    rows = [(nopat, investment, nopat - investment)]
+    for _ in range(growth_year):
+        nopat = capital_ending * roc_post_tax
+        investment = nopat * reinvestment_rate_1
+        rows.append((nopat, investment, nopat - investment))
+        capital_ending = capital_ending + investment
+    return tuple(rows), capital_ending
 
-    terminal_nopat = nopats[-1] * (1 + terminal_growth) / (coc - terminal_growth)
-    terminal_investment = terminal_nopat * reinvestment_rate_2
+
+@functools.lru_cache(maxsize=4096)
+def cash_flows(roc_pre_tax, initial_egv, growth_year, fade_period, terminal_growth):
+    # The growth-phase prefix from the cache, extended through the fade period; the CoC only enters when discounting
+    rows, capital_ending = growth_phase(roc_pre_tax, initial_egv, growth_year)
+    roc_post_tax = roc_pre_tax / 100 * (1 - TAX_RATE)
+    initial_egv = initial_egv / 100
+    terminal_growth = terminal_growth / 100
+    decline = (initial_egv - terminal_growth) / fade_period
+
+    earning_growth_rate = max(initial_egv, terminal_growth) if growth_year else initial_egv
+    tail = []
+    for _ in range(fade_period):
+        earning_growth_rate = max(earning_growth_rate - decline, terminal_growth)
+        nopat = capital_ending * roc_post_tax
+        investment = nopat * (earning_growth_rate / roc_post_tax)
+        tail.append((nopat, investment, nopat - investment))
+        capital_ending = capital_ending + investment
+    return rows + tuple(tail)
+
+
+@functools.lru_cache(maxsize=256)
+def discount_factors(coc, years):
+    return tuple(1 / (1 + coc / 100) ** n for n in range(years))
+
+
+def terminal_value(last_nopat, roc_pre_tax, coc, terminal_growth, discount_factor):
+    # (nopat, investment, fcf, discounted fcf) of the terminal value, from the last year's NOPAT
+    roc_post_tax = roc_pre_tax / 100 * (1 - TAX_RATE)
+    coc, terminal_growth = coc / 100, terminal_growth / 100
+    terminal_nopat = last_nopat * (1 + terminal_growth) / (coc - terminal_growth)
+    terminal_investment = terminal_nopat * (terminal_growth / roc_post_tax)  # Reinvestment rate after fade period
     terminal_fcf = terminal_nopat - terminal_investment
-    terminal_discounted_fcf = terminal_fcf * discount_factors[-1]
+    return terminal_nopat, terminal_investment, terminal_fcf, terminal_fcf * discount_factor
+
+
+def intrinsic_pe(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth):
+    """dcf_schedule(...)['intrinsic_pe'] without building the schedule, for solvers that try many cases."""
+    rows = cash_flows(roc_pre_tax, initial_egv, growth_year, fade_period, terminal_growth)
+    factors = discount_factors(coc, len(rows))
+    terminal_discounted_fcf = terminal_value(rows[-1][0], roc_pre_tax, coc, terminal_growth, factors[-1])[3]
+    return (sum(fcf * factor for (_, _, fcf), factor in zip(rows, factors)) + terminal_discounted_fcf) / rows[0][0]
+
+
+def dcf_schedule(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth):
+    """
+    The DCF year by year (nopat, investment, fcf, discount factor, discounted fcf, per 100 of capital),
+    the terminal value and the intrinsic PE. Same result as calculate_intrinsic_value, computed from the
+    cached undiscounted cash flows, so usually only the discounting runs.
+    """
+    rows = cash_flows(roc_pre_tax, initial_egv, growth_year, fade_period, terminal_growth)
+    factors = discount_factors(coc, len(rows))
+    discounted_fcfs = [fcf * factor for (_, _, fcf), factor in zip(rows, factors)]
+
+    terminal_nopat, terminal_investment, terminal_fcf, terminal_discounted_fcf = terminal_value(
+        rows[-1][0], roc_pre_tax, coc, terminal_growth, factors[-1])
+
+    return {
+        'year': list(range(len(rows))),
+        'nopat': [row[0] for row in rows],
+        'investment': [row[1] for row in rows],
+        'fcf': [row[2] for row in rows],
+        'discount_factor': list(factors),
+        'discounted_fcf': discounted_fcfs,
+        'terminal': {'nopat': terminal_nopat, 'investment': terminal_investment, 'fcf': terminal_fcf,
+                     'discount_factor': factors[-1], 'discounted_fcf': terminal_discounted_fcf},
+        'intrinsic_pe': (sum(discounted_fcfs) + terminal_discounted_fcf) / rows[0][0],
+    }
+
+
+@timed('calculate_intrinsic_value')
+def calculate_intrinsic_value(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth, scrap):
+    schedule = dcf_schedule(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth)
+    intrinsic_pe = schedule['intrinsic_pe']
+
+    return intrinsic_pe, overvaluation(intrinsic_pe, scrap)
 
-    intrinsic_value = sum(discounted_fcfs) + terminal_discounted_fcf
-    intrinsic_pe = intrinsic_value / nopats[0]
 
-    scrap = scrap
+def overvaluation(intrinsic_pe, scrap):
     current_pe = scrap['Stock P/E']
     fy23_pe = scrap['FY23 P/E']
 
@@ -67,4 +167,4 @@ def calculate_intrinsic_value(roc_pre_tax, coc, initial_egv, growth_year, fade_p
     else:
         overeval = (fy23_pe / round(intrinsic_pe, 2)) - 1
 
-    return intrinsic_pe, overeval
+    return overeval
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No cross-worker lock on Windows; each worker may build its own copy
+
+import metrics
+from files import atomic_path
+from metrics import timed
+import pe_calc
+from pe_calc import intrinsic_pe_batch, calculate_intrinsic_value, overvaluation
+
+# Slider domains from app.layout, in calculate_intrinsic_value argument order: (start, stop, step)
+SLIDER_GRID = [
+    ('roce', 10, 100, 5),
+    ('coc', 8, 16, 0.5),
+    ('growth', 8, 20, 1),
+    ('high_growth_period', 10, 25, 1),
+    ('fade_period', 5, 20, 5),
+    ('terminal_growth', 0, 7.5, 0.5),
+]
+AXES = [np.arange(start, stop + step / 2, step) for _, start, stop, step in SLIDER_GRID]
+SHAPE = tuple(len(axis) for axis in AXES)
+
+_table = None
+_table_info = {}
+_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def table_path():
+    # The file name carries a fingerprint of the grid and of the DCF model (pe_calc's source, tax rate included),
+    # so a changed slider domain or model never reads a table built by the old one
+    fingerprint = hashlib.sha1(repr(SLIDER_GRID).encode())
+    with open(pe_calc.__file__, 'rb') as f:
+        fingerprint.update(f.read())
+    fingerprint.update(repr(pe_calc.TAX_RATE).encode())
+    directory = os.environ.get('REVERSEDCF_TABLE_DIR', tempfile.gettempdir())
+    return os.path.join(directory, f'reversedcf_pe_table_{fingerprint.hexdigest()[:10]}.npy')
+
+
+def build_table(path):
+    start = time.perf_counter()
+    with atomic_path(path) as partial_path:  # Other workers never map a half-written file
+        table = np.lib.format.open_memmap(partial_path, mode='w+', dtype=np.float64, shape=SHAPE)
+
+        # One RoCE value at a time keeps the temporaries of intrinsic_pe_batch small
+        rest = np.meshgrid(*AXES[1:], indexing='ij')
+        for i, roce in enumerate(AXES[0]):
+            table[i] = intrinsic_pe_batch(roce, *rest)
+
+        table.flush()
+        del table
+    return time.perf_counter() - start
+
+
+def build_once(path):
+    """
+    Build the table unless it exists. Workers take a lock file first, so the first one builds it and the
+    others wait for it and map the finished file. Returns the seconds this worker spent building.
+    """
+    if os.path.exists(path):
+        return 0.0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not fcntl:
+        return build_table(path)
+
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return build_table(path) if not os.path.exists(path) else 0.0
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_table():
+    """
+    Intrinsic PE for every slider combination, memory-mapped read-only from a .npy file.
+    The first caller in any worker builds the file; everyone else maps the same pages.
+    """
+    global _table
+    with _lock:
+        if _table is None:
+            path = table_path()
+            build_seconds = build_once(path)
+            _table = np.load(path, mmap_mode='r')
+            _table_info.update({'path': path, 'shape': SHAPE, 'bytes': _table.nbytes,
+                                'build_seconds': round(build_seconds, 3)})
+            if build_seconds:
+                logger.info("Built intrinsic PE table %s (%.1f MB) in %.1fs", path, _table.nbytes / 1e6,
+                            build_seconds)
+    return _table
+
+
+def warm_table():
+    def run():
+        try:
+            get_table()
+        except Exception:
+            # Slider moves keep computing the DCF directly
+            logger.exception("Building the intrinsic PE table failed")
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def table_info():
+    return dict(_table_info)
+
+
+metrics.Collected('reversedcf_pe_table_bytes', 'Size of the mapped intrinsic PE table, 0 until it is ready', 'gauge',
+                  lambda: {(): table_info().get('bytes', 0)})
+metrics.Collected('reversedcf_pe_table_build_seconds',
+                  'Time this worker spent building the intrinsic PE table, 0 if it mapped an existing one', 'gauge',
+                  lambda: {(): table_info().get('build_seconds', 0.0)})
+
+
+def grid_index(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth):
+    index = []
+    for value, (_, start, stop, step), axis in zip(
+            (roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth), SLIDER_GRID, AXES):
+        i = int(round((value - start) / step))
+        if not 0 <= i < len(axis) or abs(axis[i] - value) > 1e-9:
+            return None  # Off the slider grid
+        index.append(i)
+    return tuple(index)
+
+
+@timed('lookup_intrinsic_value')
+def lookup_intrinsic_value(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth, scrap):
+    """
+    Same inputs and outputs as calculate_intrinsic_value, answered by an index into the precomputed table.
+    Falls back to the DCF while the table is still being built or when a value is off the slider grid.
+    """
+    index = grid_index(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth)
+    if _table is None or index is None:
+        return calculate_intrinsic_value(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth,
+                                         scrap)
+
+    intrinsic_pe = float(_table[index])
+    return intrinsic_pe, overvaluation(intrinsic_pe, scrap)
@@ -0,0 +1,233 @@
+"""
+Reverse DCF: solve for the growth (or high growth period) that makes the model's intrinsic PE equal the
+market PE, instead of computing intrinsic PE from assumed growth.
+
+    python reverse_dcf.py    # benchmark against a brute-force scan of the slider grid
+"""
+import math
+import time
+
+import numpy as np
+
+from pe_calc import intrinsic_pe_batch, intrinsic_pe
+
+SLIDER_BRACKET = (8.0, 20.0)  # Growth slider range, tried first since most answers fall inside it
+GROWTH_BRACKET = (0.0, 100.0)  # Widest range searched for implied growth (%)
+MAX_GROWTH_YEARS = 100  # Longest high growth period the period solver will consider
+
+
+def market_pe(scrap):
+    # The same PE that overvaluation() compares against: the lower of current and FY23 P/E
+    return min(scrap['Stock P/E'], scrap['FY23 P/E'])
+
+
+def brentq(f, a, b, xtol=1e-8, maxiter=100):
+    """
+    Brent's method on a bracket [a, b] with f(a), f(b) of opposite sign.
+    Returns (root, evaluations), or (None, evaluations) if the bracket holds no sign change.
+    """
+    fa, fb = f(a), f(b)
+    evaluations = 2
+    if fa * fb > 0:
+        return None, evaluations
+    if fa == 0:
+        return a, evaluations
+    if fb == 0:
+        return b, evaluations
+
+    c, fc = a, fa
+    d = e = b - a
+    for _ in range(maxiter):
+        if fb * fc > 0:
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+
+        tol = 2 * np.finfo(float).eps * abs(b) + xtol / 2
+        m = (c - b) / 2
+        if abs(m) <= tol or fb == 0:
+            return b, evaluations
+
+        if abs(e) >= tol and abs(fa) > abs(fb):
+            # Inverse quadratic interpolation, or the secant step when only two points are distinct
+            s = fb / fa
+            if a == c:
+                p, q = 2 * m * s, 1 - s
+            else:
+                q, r = fa / fc, fb / fc
+                p = s * (2 * m * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            p = abs(p)
+            if 2 * p < min(3 * m * q - abs(tol * q), abs(e * q)):
+                e, d = d, p / q
+            else:
+                d = e = m  # Interpolation would leave the bracket; bisect instead
+        else:
+            d = e = m
+
+        a, fa = b, fb
+        b += d if abs(d) > tol else (tol if m > 0 else -tol)
+        fb = f(b)
+        evaluations += 1
+
+    return b, evaluations
+
+
+def log_gap(intrinsic_pe, target_pe):
+    # PE grows roughly exponentially with growth, so the gap in logs is close to linear and converges faster.
+    # Negative intrinsic PEs (heavy reinvestment at a low RoCE) are clamped; target_pe must be positive.
+    return np.log(np.maximum(intrinsic_pe, 1e-12)) - np.log(np.maximum(target_pe, 1e-12))
+
+
+def scalar_pe(roc_pre_tax, coc, initial_egv, growth_year, fade_period, terminal_growth):
+    # One case through the cached scalar DCF, which is far cheaper than a one-element intrinsic_pe_batch call
+    return intrinsic_pe(roc_pre_tax, coc, initial_egv, int(growth_year), int(fade_period), terminal_growth)
+
+
+def solve_growth(target_pe, roc_pre_tax, coc, growth_year, fade_period, terminal_growth, xtol=1e-6):
+    """Returns (implied growth or None, number of DCF evaluations)."""
+    if not target_pe or target_pe <= 0:
+        return None, 0
+
+    log_target = math.log(target_pe)
+
+    def gap(growth):
+        pe = scalar_pe(roc_pre_tax, coc, growth, growth_year, fade_period, terminal_growth)
+        return math.log(max(pe, 1e-12)) - log_target  # Same as log_gap, on plain floats
+
+    growth, evaluations = brentq(gap, *SLIDER_BRACKET, xtol=xtol)
+    if growth is None:
+        growth, more = brentq(gap, *GROWTH_BRACKET, xtol=xtol)
+        evaluations += more
+    return growth, evaluations
+
+
+def implied_growth(target_pe, roc_pre_tax, coc, growth_year, fade_period, terminal_growth, xtol=1e-6):
+    """Growth during the high growth period (%) at which the intrinsic PE equals target_pe, or None."""
+    growth, _ = solve_growth(target_pe, roc_pre_tax, coc, growth_year, fade_period, terminal_growth, xtol)
+    return growth
+
+
+def implied_growth_period(target_pe, roc_pre_tax, coc, initial_egv, fade_period, terminal_growth):
+    """
+    High growth period (years) at which the intrinsic PE equals target_pe, or None.
+    The model only takes whole years, so the answer is interpolated between the two years that bracket it.
+    The bracket is found by doubling the period from 1 year and then narrowed by bisection over whole years,
+    about a dozen DCF evaluations in all.
+    """
+    def gap(year):
+        return scalar_pe(roc_pre_tax, coc, initial_egv, year, fade_period, terminal_growth) - target_pe
+
+    low, low_gap = 0, gap(0)
+    high = 1
+    while True:
+        high_gap = gap(high)
+        if np.sign(high_gap) != np.sign(low_gap):
+            break
+        if high == MAX_GROWTH_YEARS:
+            return None
+        low, low_gap = high, high_gap
+        high = min(2 * high, MAX_GROWTH_YEARS)
+
+    while high - low > 1:
+        middle = (low + high) // 2
+        middle_gap = gap(middle)
+        if np.sign(middle_gap) == np.sign(low_gap):
+            low, low_gap = middle, middle_gap
+        else:
+            high, high_gap = middle, middle_gap
+    return float(low + low_gap / (low_gap - high_gap))
+
+
+def implied_growth_batch(target_pe, roc_pre_tax, coc, growth_year, fade_period, terminal_growth, xtol=1e-6,
+                         maxiter=60):
+    """
+    Vectorized implied growth for a whole watchlist: every argument may be an array, and all cases are solved
+    together with the Illinois variant of regula falsi, one intrinsic_pe_batch call per iteration.
+    Cases with no root in GROWTH_BRACKET come back as NaN.
+    """
+    target_pe, roc_pre_tax, coc, growth_year, fade_period, terminal_growth = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in
+          (target_pe, roc_pre_tax, coc, growth_year, fade_period, terminal_growth)))
+
+    def gap(growth):
+        return log_gap(intrinsic_pe_batch(roc_pre_tax, coc, growth, growth_year, fade_period, terminal_growth),
+                       target_pe)
+
+    a = np.full(target_pe.shape, GROWTH_BRACKET[0])
+    b = np.full(target_pe.shape, GROWTH_BRACKET[1])
+    fa, fb = gap(a), gap(b)
+    solvable = (fa * fb <= 0) & (target_pe > 0)
+    side = np.zeros(target_pe.shape, dtype=int)  # Which end was kept last time, for the Illinois halving
+    x = b.copy()
+
+    for _ in range(maxiter):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = np.where(fb != fa, b - fb * (b - a) / (fb - fa), (a + b) / 2)
+        fx = gap(x)
+
+        keep_a = fx * fb > 0  # Root lies between a and x: x replaces b
+        fa = np.where(keep_a & (side == -1), fa / 2, fa)
+        fb = np.where(~keep_a & (side == 1), fb / 2, fb)
+        a, fa, b, fb = (np.where(keep_a, a, b), np.where(keep_a, fa, fb), x, fx)
+        side = np.where(keep_a, -1, 1)
+
+        if np.all((np.abs(b - a) <= xtol) | (fx == 0) | ~solvable):
+            break
+
+    return np.where(solvable, x, np.nan)
+
+
+def benchmark(cases=200, seed=0):
+    """Compare the solvers against scanning the growth slider (8-20% in 1% steps) for the nearest PE."""
+    rng = np.random.default_rng(seed)
+    roce = rng.choice(np.arange(10, 101, 5), cases)
+    coc = rng.choice(np.arange(8, 16.5, 0.5), cases)
+    growth_year = rng.choice(np.arange(10, 26), cases)
+    fade_period = rng.choice([5, 10, 15, 20], cases)
+    terminal_growth = rng.choice(np.arange(0, 8, 0.5), cases)
+    true_growth = rng.uniform(8, 20, cases)
+    target_pe = intrinsic_pe_batch(roce, coc, true_growth, growth_year, fade_period, terminal_growth)
+
+    # A market PE is positive, so drop the cases where heavy reinvestment at a low RoCE gives a negative PE
+    keep = target_pe > 0
+    roce, coc, growth_year, fade_period, terminal_growth, true_growth, target_pe = (
+        roce[keep], coc[keep], growth_year[keep], fade_period[keep], terminal_growth[keep], true_growth[keep],
+        target_pe[keep])
+    cases = len(target_pe)
+
+    start = time.perf_counter()
+    grid = np.arange(8, 21)
+    grid_pe = intrinsic_pe_batch(roce[:, None], coc[:, None], grid, growth_year[:, None], fade_period[:, None],
+                                 terminal_growth[:, None])
+    brute = grid[np.argmin(np.abs(grid_pe - target_pe[:, None]), axis=1)]
+    brute_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    evaluations = []
+    scalar = []
+    for i in range(cases):
+        root, count = solve_growth(target_pe[i], roce[i], coc[i], growth_year[i], fade_period[i],
+                                   terminal_growth[i])
+        scalar.append(root)
+        evaluations.append(count)
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = implied_growth_batch(target_pe, roce, coc, growth_year, fade_period, terminal_growth)
+    batch_seconds = time.perf_counter() - start
+
+    print(f"Brute-force scan ({len(grid)} DCFs per case): {brute_seconds * 1000:.1f} ms, "
+          f"max error {np.max(np.abs(brute - true_growth)):.3f} pp")
+    print(f"Brent, one case at a time: {scalar_seconds * 1000:.1f} ms, {np.mean(evaluations):.1f} DCFs per case "
+          f"on average, max error {np.max(np.abs(np.array(scalar) - true_growth)):.2e} pp")
+    print(f"Vectorized regula falsi: {batch_seconds * 1000:.1f} ms for all {cases} cases, "
+          f"max error {np.nanmax(np.abs(batch - true_growth)):.2e} pp")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,109 +1,422 @@
+import contextvars
+import logging
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import statistics
+import time
+from cache import QUOTE_TTL, ANNUAL_TTL, SingleFlight, cache_from_env
+import metrics
+from metrics import timed
+from upstream import TokenBucket, CircuitBreaker, backoff_delay
 
-def scrape_from_url(url):
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get(url, headers=headers)
+SCREENER_URL = os.environ.get('REVERSEDCF_SCREENER_URL', 'https://www.screener.in')  # Point at stub_server.py offline
+MAX_CONNECTIONS = int(os.environ.get('REVERSEDCF_MAX_CONNECTIONS', 8))  # Concurrent upstream requests per worker
+REQUEST_TIMEOUT = (3.05, 10)  # (connect, read) seconds, so a hung upstream can't hold a worker forever
+PARALLEL_FALLBACK = os.environ.get('REVERSEDCF_PARALLEL_FALLBACK', '1') == '1'
+HEDGE_DELAY = float(os.environ.get('REVERSEDCF_HEDGE_DELAY', 0.5))  # Seconds before a slow consolidated page is hedged
+RATE_LIMIT = float(os.environ.get('REVERSEDCF_RATE_LIMIT', 5))  # Upstream requests per second per worker, 0 for none
+RATE_BURST = int(os.environ.get('REVERSEDCF_RATE_BURST', 10))
+MAX_RETRIES = int(os.environ.get('REVERSEDCF_MAX_RETRIES', 2))  # Retries after a 429, a 5xx or a connection error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+# One keep-alive session shared by every fetch in this worker
+http = requests.Session()
+http.headers.update({'User-Agent': 'Mozilla/5.0'})
+http_adapter = HTTPAdapter(pool_connections=2, pool_maxsize=MAX_CONNECTIONS)
+http.mount('https://', http_adapter)
+http.mount('http://', http_adapter)
+fetch_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+fetch_pool = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix='scraper')
+rate_limiter = TokenBucket(RATE_LIMIT, RATE_BURST)
+breaker = CircuitBreaker(failure_threshold=int(os.environ.get('REVERSEDCF_BREAKER_FAILURES', 5)),
+                         reset_timeout=float(os.environ.get('REVERSEDCF_BREAKER_RESET', 30)))
+
+
+# The only parts of a company page the parsers below read. #top-ratios has no nested <ul> and screener
+# sections are not nested, so each one runs from its opening tag to the first matching close tag.
+PAGE_SECTIONS = [
+    (re.compile(rb'<ul[^>]*\bid="top-ratios"'), b'</ul>'),
+    (re.compile(rb'<section[^>]*\bid="profit-loss"'), b'</section>'),  # Also holds the .ranges-table growth tables
+    (re.compile(rb'<section[^>]*\bid="ratios"'), b'</section>'),
+]
+
+
+def extract_sections(content):
+    """Slice the raw HTML down to PAGE_SECTIONS, or None if any of them can't be found."""
+    parts = []
+    for start_pattern, end_tag in PAGE_SECTIONS:
+        match = start_pattern.search(content)
+        end = content.find(end_tag, match.end()) if match else -1
+        if end == -1:
+            return None
+        parts.append(content[match.start():end + len(end_tag)])
+    return b''.join(parts)
+
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+@timed('parse_html')
+def parse_html(content):
+    # Building a tree for only the sections we read is 10-15x faster than parsing the whole page
+    sections = extract_sections(content)
+    if sections is None:
+        return BeautifulSoup(content, 'html.parser')  # Unfamiliar layout: parse everything
+
+    # The slices lose the page's <meta charset>, so pass it on explicitly
+    charset = META_CHARSET.search(content)
+    return BeautifulSoup(sections, 'html.parser', from_encoding=charset.group(1).decode() if charset else 'utf-8')
 
-    if response.status_code == 200:
-        return BeautifulSoup(response.content, 'html.parser')
+
+def fetch(url):
+    """
+    GET url at the rate the limiter allows, retrying 429, 5xx and connection errors with backoff.
+    Returns the last response, or None after a read timeout, a connection error or while the breaker is open.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if not breaker.allow():
+            return None  # screener.in is failing: don't wait on it, callers fall back to cached data
+
+        rate_limiter.acquire()
+        start = time.perf_counter()
+        response = error = None
+        try:
+            with fetch_slots:
+                response = http.get(url, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            error = e
+        finally:
+            metrics.observe('fetch', time.perf_counter() - start)
+
+        metrics.upstream_responses.inc(status=response.status_code if response is not None else 'error')
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            breaker.record_success()  # Including 404s: the upstream is answering
+            rate_limiter.recover()
+            return response
+
+        if response is not None and response.status_code == 429:
+            breaker.record_success()  # Throttled but answering, which also settles a half-open trial
+            rate_limiter.slow_down()
+        else:
+            breaker.record_failure()
+        # Not after a read timeout, which has already held the caller for the full 10 s
+        retryable = response is not None or isinstance(error, requests.ConnectionError)
+        if attempt == MAX_RETRIES or not retryable:
+            logger.warning("Fetching %s failed: %s", url, error or f"HTTP {response.status_code}")
+            return response
+
+        metrics.upstream_retries.inc()
+        time.sleep(backoff_delay(attempt, response.headers.get('Retry-After') if response is not None else None))
+
+
+def scrape_from_url(url):
+    response = fetch(url)
+    if response is not None and response.status_code == 200:
+        return parse_html(response.content)
     else:
-        return None
+        return None  # Timeouts, errors and non-200 pages all count as a missing page
+
+
+def company_urls(symbol):
+    # URLs to try: first consolidated, then regular if the first fails.
+    return [f"{SCREENER_URL}/company/{symbol}/consolidated/", f"{SCREENER_URL}/company/{symbol}/"]
+
+
+@timed('parse_top_ratios')
+def parse_top_ratios(soup):
+    data = {'Market Cap': None, 'Stock P/E': None}
+    top_ratios = soup.find('ul', id='top-ratios')
+    if top_ratios:
+        for li in top_ratios.find_all('li', class_='flex flex-space-between'):
+            name_span = li.find('span', class_='name')
+            if name_span and 'Market Cap' in name_span.string:
+                market_cap_span = li.find('span', class_='number')
+                if market_cap_span:
+                    market_cap_text = market_cap_span.text.strip()
+                    if market_cap_text:
+                        try:
+                            data['Market Cap'] = float(market_cap_text.replace('Cr.', '').replace(',', ''))
+                        except ValueError:
+                            continue  # If parsing fails, continue to the next element
+            elif name_span and 'Stock P/E' in name_span.string:
+                stock_pe_span = li.find('span', class_='number')
+                if stock_pe_span:
+                    stock_pe_text = stock_pe_span.text.strip()
+                    if stock_pe_text:
+                        try:
+                            data['Stock P/E'] = float(stock_pe_text)
+                        except ValueError:
+                            continue  # If parsing fails, continue to the next element
+    return data
+
+
+@timed('parse_net_profit_row')
+def parse_net_profit_row(soup):
+    profit_loss_section = soup.find('section', id='profit-loss')
+    if profit_loss_section:
+        for tr in profit_loss_section.find_all('tr', class_='strong'):
+            td = tr.find('td', class_='text')
+            if td and 'Net Profit' in td.text:
+                return [td.text.strip() for td in tr.find_all('td')[1:]]
+    return []
+
+
+@timed('parse_roce_row')
+def parse_roce_row(soup):
+    roce_values = []
+    ratios_section = soup.find('section', id='ratios')
+    if ratios_section:
+        for roce_td in ratios_section.find_all('td', class_='text'):
+            if 'ROCE %' in roce_td.text:
+                roce_tr = roce_td.parent
+                roce_values.extend([td.text.strip() for td in roce_tr.find_all('td')[1:] if td.text.strip()])
+    return roce_values
+
+
+@timed('parse_section_years')
+def parse_section_years(soup, section_id):
+    # Column headings of the first table in a section, e.g. ['Mar 2013', ..., 'TTM']
+    section = soup.find('section', id=section_id)
+    header = section.find('thead') if section else None
+    return [th.text.strip() for th in header.find_all('th')[1:]] if header else []
+
+
+@timed('parse_growth_tables')
+def parse_growth_tables(soup):
+    sales_growth_rates = []
+    profit_growth_rates = []
+    tables = soup.find_all('table', class_='ranges-table')
+
+    # Assuming the first two tables are always Sales Growth and Profit Growth respectively
+    for table in tables[:2]:
+        rows = table.find_all('tr')[1:]  # Skip header row
+        for row in rows:
+            cells = row.find_all('td')
+            if len(cells) == 2:
+                growth_rate = cells[1].text.strip()
+                if table.th.text.strip() == "Compounded Sales Growth":
+                    sales_growth_rates.append(growth_rate)
+                else:
+                    profit_growth_rates.append(growth_rate)
+
+    return sales_growth_rates, profit_growth_rates
+
+
+@timed('parse_company_page')
+def parse_company_page(soup):
+    """
+    Extract every field the app needs from one parsed company page.
+    Values are kept as the raw cell text where the views below decide how to convert them.
+    """
+    page = parse_top_ratios(soup)
+    page['Net Profit'] = parse_net_profit_row(soup)
+    page['Profit Loss Years'] = parse_section_years(soup, 'profit-loss')
+    page['ROCE %'] = parse_roce_row(soup)
+    page['Ratio Years'] = parse_section_years(soup, 'ratios')
+    page['Valid Growth'] = has_valid_percentage_data(soup)
+    page['Sales Growth'], page['Profit Growth'] = parse_growth_tables(soup)
+    return page
+
+
+def has_page_data(page):
+    # What the quote view needs; a consolidated page without it sends the views on to the standalone page
+    return page is not None and page['Market Cap'] is not None and len(page['Net Profit']) >= 2
 
-def scrape_net_profit_second_last(symbol):
-    urls = [f"https://www.screener.in/company/{symbol}/consolidated/", f"https://www.screener.in/company/{symbol}/"]
 
-    for url in urls:
+page_flight = SingleFlight()
+
+
+def load_page(url):
+    """parse_company_page() of one URL, or None. Concurrent calls for the same URL share a single fetch."""
+    def load():
         soup = scrape_from_url(url)
-        if soup:
-            profit_loss_section = soup.find('section', id='profit-loss')
-            if profit_loss_section:
-                net_profit_row = None
-                for tr in profit_loss_section.find_all('tr', class_='strong'):
-                    td = tr.find('td', class_='text')
-                    if td and 'Net Profit' in td.text:
-                        net_profit_row = tr
-                        break
-
-                if net_profit_row:
-                    net_profit_values = [td.text.strip() for td in net_profit_row.find_all('td')[1:]]
-                    if len(net_profit_values) >= 2:
-                        second_last_value = net_profit_values[-2]
-                        net_profit = float(second_last_value.replace(',', ''))
-                        return net_profit
+        return parse_company_page(soup) if soup else None
+    return page_flight.do(url, load)
+
+
+class CompanySnapshot:
+    """
+    Parsed consolidated/standalone pages for one symbol.
+    Each page is fetched and parsed at most once, and the standalone page is only fetched when a view falls
+    back to it, unless fetch_all() has already requested it alongside a failing or slow consolidated page.
+    """
+
+    def __init__(self, symbol, pages=None, fetched_at=None):
+        self.symbol = symbol
+        self.pages = pages or {}  # url -> parsed page, or None if the fetch failed
+        self.fetched_at = fetched_at or time.time()
+
+    def iter_pages(self):
+        for i, url in enumerate(company_urls(self.symbol)):
+            metrics.page_reads.inc(page='standalone' if i else 'consolidated')
+            if url not in self.pages:
+                self.pages[url] = load_page(url)
+            if self.pages[url] is not None:
+                yield self.pages[url]
+
+    def fetch_all(self):
+        """
+        Fetch the consolidated page and return as soon as it has the data, which is one request for most symbols.
+        The standalone page is requested too once the consolidated one fails, lacks the data or has taken
+        HEDGE_DELAY seconds; if the consolidated page then turns out fine, the standalone one is dropped.
+        """
+        def start(load, *args):
+            # On the bounded pool, in a copy of the caller's context so a profiled request sees these timings
+            return fetch_pool.submit(contextvars.copy_context().run, load, *args)
+
+        def consolidated_has_data():
+            return consolidated.done() and consolidated.exception() is None and has_page_data(consolidated.result())
+
+        def load_standalone():
+            # The pool thread that finished the consolidated page may pick this up before fetch_all() wakes to
+            # cancel it, so look again before sending the request
+            return None if consolidated_has_data() else load_page(standalone_url)
+
+        consolidated_url, standalone_url = company_urls(self.symbol)
+        consolidated = start(load_page, consolidated_url)
+        wait([consolidated], timeout=HEDGE_DELAY)
+        if consolidated_has_data():
+            self.pages[consolidated_url] = consolidated.result()
+            return
+
+        standalone = start(load_standalone)
+        pending = {consolidated, standalone}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if consolidated in done:
+                self.pages[consolidated_url] = consolidated.result()
+                if has_page_data(self.pages[consolidated_url]):
+                    standalone.cancel()  # Not sent if it is still queued; if it is running, its page is ignored
+                    return
+            if standalone in done:
+                self.pages[standalone_url] = standalone.result()
+
+    def has_data(self):
+        return any(page is not None for page in self.pages.values())
+
+    def to_dict(self):
+        return {'symbol': self.symbol, 'fetched_at': self.fetched_at, 'pages': self.pages}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['symbol'], data['pages'], data['fetched_at'])
+
+
+def load_snapshot(symbol):
+    snapshot = CompanySnapshot(symbol)
+    if PARALLEL_FALLBACK:
+        snapshot.fetch_all()  # A slow or missing consolidated page then costs no extra round trip
+    else:
+        next(snapshot.iter_pages(), None)  # Fetch the first page that loads; the other only if a view needs it
+    return snapshot
+
+
+snapshot_cache = cache_from_env(load_snapshot, CompanySnapshot.from_dict)
+metrics.Collected('reversedcf_snapshot_cache_events_total', 'Snapshot cache lookups and reloads by outcome', 'counter',
+                  lambda: {(event,): count for event, count in snapshot_cache.stats.items()}, labels=('event',))
+metrics.Collected('reversedcf_snapshot_cache_hit_ratio', 'Share of snapshot lookups answered from the cache',
+                  'gauge', lambda: {(): snapshot_cache.info()['hit_ratio']})
+metrics.Collected('reversedcf_coalesced_total',
+                  'Loads that waited on an identical in-flight load instead of calling screener.in themselves',
+                  'counter', lambda: {('snapshot',): snapshot_cache.flight.stats['shared'],
+                                      ('page',): page_flight.stats['shared'],
+                                      ('worker',): snapshot_cache.stats['worker_coalesced']}, labels=('level',))
+metrics.Collected('reversedcf_circuit_state', 'Upstream circuit breaker state (1 for the current one)', 'gauge',
+                  lambda: {(state,): int(breaker.state == state) for state in
+                           (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)}, labels=('state',))
+metrics.Collected('reversedcf_circuit_events_total', 'Times the breaker opened, and requests it rejected', 'counter',
+                  lambda: {(event,): count for event, count in breaker.stats.items()}, labels=('event',))
+metrics.Collected('reversedcf_rate_limit_per_second', 'Current upstream request rate allowed, lowered after 429s',
+                  'gauge', lambda: {(): rate_limiter.rate})
+metrics.Collected('reversedcf_rate_limit_wait_seconds_total', 'Time fetches spent waiting on the rate limiter',
+                  'counter', lambda: {(): rate_limiter.waited})
+metrics.Collected('reversedcf_snapshot_cache_entries', 'Snapshots held in memory', 'gauge',
+                  lambda: {(): len(snapshot_cache.entries)})
+
+
+def get_snapshot(symbol, ttl=ANNUAL_TTL):
+    # Pass QUOTE_TTL when reading market cap or P/E. An older entry is still served once while it reloads in
+    # the background, and for up to MAX_STALE (7 days) while the reloads keep failing
+    return snapshot_cache.get(symbol, ttl)
+
+
+def scrape_net_profit_second_last(symbol, snapshot=None):
+    snapshot = snapshot or get_snapshot(symbol)
+
+    for page in snapshot.iter_pages():
+        net_profit_values = page['Net Profit']
+        if len(net_profit_values) >= 2:
+            second_last_value = net_profit_values[-2]
+            net_profit = float(second_last_value.replace(',', ''))
+            return net_profit
 
     return None
 
-def scrape_market_cap_and_pe(symbol):
-    # URLs to try: first consolidated, then regular if the first fails.
-    urls = [f"https://www.screener.in/company/{symbol}/consolidated/", f"https://www.screener.in/company/{symbol}/"]
+def scrape_market_cap_and_pe(symbol, snapshot=None):
+    snapshot = snapshot or get_snapshot(symbol, QUOTE_TTL)
 
-    for url in urls:
-        soup = scrape_from_url(url)
-        if soup:
-            data = {'Market Cap': None, 'Stock P/E': None, 'FY23 P/E': None, 'Net Profit': None}
-            top_ratios = soup.find('ul', id='top-ratios')
-            if top_ratios:
-                for li in top_ratios.find_all('li', class_='flex flex-space-between'):
-                    name_span = li.find('span', class_='name')
-                    if name_span and 'Market Cap' in name_span.string:
-                        market_cap_span = li.find('span', class_='number')
-                        if market_cap_span:
-                            market_cap_text = market_cap_span.text.strip()
-                            if market_cap_text:
-                                try:
-                                    data['Market Cap'] = float(market_cap_text.replace('Cr.', '').replace(',', ''))
-                                except ValueError:
-                                    continue  # If parsing fails, continue to the next element
-                    elif name_span and 'Stock P/E' in name_span.string:
-                        stock_pe_span = li.find('span', class_='number')
-                        if stock_pe_span:
-                            stock_pe_text = stock_pe_span.text.strip()
-                            if stock_pe_text:
-                                try:
-                                    data['Stock P/E'] = float(stock_pe_text)
-                                except ValueError:
-                                    continue  # If parsing fails, continue to the next element
-
-            net_profit = scrape_net_profit_second_last(symbol)
-            if net_profit is not None and data['Market Cap'] is not None:
-                data['FY23 P/E'] = round(data['Market Cap'] / net_profit, 2)
-                data['Net Profit'] = net_profit
-                return data  # Return the data if successful
+    for page in snapshot.iter_pages():
+        data = {'Market Cap': page['Market Cap'], 'Stock P/E': page['Stock P/E'], 'FY23 P/E': None, 'Net Profit': None}
+
+        net_profit = scrape_net_profit_second_last(symbol, snapshot)
+        if net_profit is not None and data['Market Cap'] is not None:
+            data['FY23 P/E'] = round(data['Market Cap'] / net_profit, 2)
+            data['Net Profit'] = net_profit
+            return data  # Return the data if successful
 
     # If both attempts fail, return None
     return None
 
 
-def scrape_roce_median(symbol):
-    # URLs to try: first consolidated, then regular if the first fails.
-    urls = [f"https://www.screener.in/company/{symbol}/consolidated/", f"https://www.screener.in/company/{symbol}/"]
+def scrape_roce_median(symbol, snapshot=None):
+    snapshot = snapshot or get_snapshot(symbol)
 
-    for url in urls:
-        soup = scrape_from_url(url)
-        if soup:
-            roce_values = []
-            ratios_section = soup.find('section', id='ratios')
-            if ratios_section:
-                roce_tds = ratios_section.find_all('td', class_='text')
-                for roce_td in roce_tds:
-                    if 'ROCE %' in roce_td.text:
-                        roce_tr = roce_td.parent
-                        roce_values_td = roce_tr.find_all('td')[1:]
-                        roce_values.extend([float(td.text.strip('%')) for td in roce_values_td if td.text.strip()])
-
-            if len(roce_values) >= 6:
-                try:
-                    median = statistics.median(roce_values[-6:-1])
-                    return median
-                except statistics.StatisticsError:
-                    print("Error: Unable to compute median for RoCE values.")
-                    continue  # Continue to next URL if median computation fails
+    for page in snapshot.iter_pages():
+        roce_values = [float(value.strip('%')) for value in page['ROCE %']]
+
+        if len(roce_values) >= 6:
+            try:
+                median = statistics.median(roce_values[-6:-1])
+                return median
+            except statistics.StatisticsError:
+                print("Error: Unable to compute median for RoCE values.")
+                continue  # Continue to next URL if median computation fails
 
     return None  # Return None if all attempts fail
 
 
+def scrape_history(symbol, snapshot=None):
+    """
+    Year-by-year Net Profit and ROCE % from the same pages the views above read, as (year, value) pairs.
+    Cached pages from before year headings were parsed come back with empty year labels.
+    """
+    snapshot = snapshot or get_snapshot(symbol)
+    history = {'Net Profit': [], 'ROCE %': []}
+
+    for page in snapshot.iter_pages():
+        if len(page['Net Profit']) >= 2:
+            years = page.get('Profit Loss Years') or [''] * len(page['Net Profit'])
+            history['Net Profit'] = [(year, float(value.replace(',', '')))
+                                     for year, value in zip(years, page['Net Profit']) if value]
+            break
+
+    for page in snapshot.iter_pages():
+        if len(page['ROCE %']) >= 6:
+            years = page.get('Ratio Years') or [''] * len(page['ROCE %'])
+            history['ROCE %'] = [(year, float(value.strip('%'))) for year, value in zip(years, page['ROCE %'])]
+            break
+
+    return history
+
+
+@timed('has_valid_percentage_data')
 def has_valid_percentage_data(soup):
     """
     Check if the page contains valid percentage data.
@@ -118,32 +431,12 @@ def has_valid_percentage_data(soup):
                 return False
     return True
 
-def scrape_compounded_growth(symbol):
-    base_url = "https://www.screener.in/company/{}/{}"
-    urls_to_try = ["consolidated", ""]  # First try consolidated, then the standard page
+def scrape_compounded_growth(symbol, snapshot=None):
+    snapshot = snapshot or get_snapshot(symbol)
 
-    sales_growth_rates = []
-    profit_growth_rates = []
-
-    for url_suffix in urls_to_try:
-        url = base_url.format(symbol, url_suffix)
-        soup = scrape_from_url(url)
-        if soup and has_valid_percentage_data(soup):
-            tables = soup.find_all('table', class_='ranges-table')
-
-            # Assuming the first two tables are always Sales Growth and Profit Growth respectively
-            for table in tables[:2]:
-                rows = table.find_all('tr')[1:]  # Skip header row
-                for row in rows:
-                    cells = row.find_all('td')
-                    if len(cells) == 2:
-                        growth_rate = cells[1].text.strip()
-                        if table.th.text.strip() == "Compounded Sales Growth":
-                            sales_growth_rates.append(growth_rate)
-                        else:
-                            profit_growth_rates.append(growth_rate)
-
-            return sales_growth_rates, profit_growth_rates  # Return arrays
+    for page in snapshot.iter_pages():
+        if page['Valid Growth']:
+            return page['Sales Growth'], page['Profit Growth']  # Return arrays
 
     return None  # Return None if no valid data was found
 
@@ -0,0 +1,50 @@
+import numpy as np
+
+from pe_calc import intrinsic_pe_batch
+from pe_table import SLIDER_GRID, AXES
+from reverse_dcf import market_pe
+
+PARAMS = [name for name, _, _, _ in SLIDER_GRID]  # intrinsic_pe_batch argument order
+LABELS = {
+    'roce': 'RoCE (%)',
+    'coc': 'Cost of Capital (%)',
+    'growth': 'High growth (%)',
+    'high_growth_period': 'High growth period (years)',
+    'fade_period': 'Fade period (years)',
+    'terminal_growth': 'Terminal growth (%)',
+}
+
+
+def sensitivity_analysis(params, scrap, x_param='coc', y_param='growth'):
+    """
+    Heatmap of intrinsic PE over the full slider ranges of x_param and y_param, plus a tornado of overvaluation
+    with each parameter moved to its slider minimum and maximum while the rest stay at params.
+    Both come from a single intrinsic_pe_batch call.
+    """
+    axes = dict(zip(PARAMS, AXES))
+    x_values, y_values = axes[x_param], axes[y_param]
+
+    # Heatmap cases, y along rows and x along columns
+    heatmap_cases = {name: np.full((len(y_values), len(x_values)), float(params[name])) for name in PARAMS}
+    heatmap_cases[x_param] = np.broadcast_to(x_values, heatmap_cases[x_param].shape)
+    heatmap_cases[y_param] = np.broadcast_to(y_values[:, None], heatmap_cases[y_param].shape)
+
+    # Tornado cases: base, then (low, high) for each parameter
+    tornado_cases = {name: np.full(1 + 2 * len(PARAMS), float(params[name])) for name in PARAMS}
+    for i, name in enumerate(PARAMS):
+        tornado_cases[name][1 + 2 * i] = axes[name][0]
+        tornado_cases[name][2 + 2 * i] = axes[name][-1]
+
+    intrinsic_pe = intrinsic_pe_batch(*(np.concatenate([heatmap_cases[name].ravel(), tornado_cases[name]])
+                                        for name in PARAMS))
+    heatmap = intrinsic_pe[:heatmap_cases[x_param].size].reshape(len(y_values), len(x_values))
+    tornado_pe = intrinsic_pe[heatmap_cases[x_param].size:]
+
+    overeval = market_pe(scrap) / np.round(tornado_pe, 2) - 1
+    base = overeval[0]
+    tornado = [{'param': name, 'low_value': axes[name][0], 'high_value': axes[name][-1],
+                'low': overeval[1 + 2 * i], 'high': overeval[2 + 2 * i]}
+               for i, name in enumerate(PARAMS)]
+    tornado.sort(key=lambda bar: abs(bar['high'] - bar['low']))  # Widest bar ends up on top of the chart
+
+    return {'x': x_values, 'y': y_values, 'intrinsic_pe': heatmap, 'base_overvaluation': base, 'tornado': tornado}
@@ -0,0 +1,109 @@
+"""
+Local stand-in for screener.in that serves the saved pages in fixtures/, so the scraper and the app
+can run offline:
+
+    python stub_server.py --port 8001
+    REVERSEDCF_SCREENER_URL=http://127.0.0.1:8001 python app.py
+
+/company/<SYMBOL>/consolidated/ serves fixtures/<SYMBOL>.consolidated.html and /company/<SYMBOL>/ serves
+fixtures/<SYMBOL>.html; anything else is a 404.
+
+To exercise the scraper's rate limiter, backoff and circuit breaker, the stub can also misbehave like a
+loaded upstream: --rate-limit answers 429 with Retry-After beyond that many requests per second,
+--error-rate answers a random share of requests with 503, and --status answers everything with one code
+(set server.status at runtime to start or end an outage).
+"""
+import argparse
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+COMPANY_PATH = re.compile(r'^/company/([^/]+)/(consolidated/)?$')
+
+
+class StubScreenerHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        stub = self.server
+        with stub.lock:
+            stub.requests.append(self.path)
+            now = time.monotonic()
+            stub.recent = [t for t in stub.recent if now - t < 1.0] + [now]
+            throttled = stub.rate_limit and len(stub.recent) > stub.rate_limit
+        if stub.delay:
+            time.sleep(stub.delay)
+
+        if throttled:
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if stub.status or (stub.error_rate and random.random() < stub.error_rate):
+            self.send_error(stub.status or 503)
+            return
+
+        match = COMPANY_PATH.match(self.path)
+        path = None
+        if match:
+            suffix = '.consolidated.html' if match.group(2) else '.html'
+            path = os.path.join(stub.fixtures_dir, match.group(1) + suffix)
+
+        if path is None or not os.path.exists(path):
+            self.send_error(404)
+            return
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep test and benchmark output quiet
+
+
+class StubScreenerServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, fixtures_dir=FIXTURES_DIR, delay=0.0, rate_limit=0, error_rate=0.0, status=None):
+        super().__init__(('127.0.0.1', port), StubScreenerHandler)
+        self.fixtures_dir = fixtures_dir
+        self.delay = delay  # Seconds to wait before every response, to mimic a slow upstream
+        self.rate_limit = rate_limit  # Requests per second answered before returning 429s, 0 for no limit
+        self.error_rate = error_rate  # Share of requests answered with a 503
+        self.status = status  # Answer every request with this status, e.g. 503 for an outage
+        self.requests = []
+        self.recent = []  # Arrival times within the last second, for rate_limit
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+def start_stub_server(port=0, fixtures_dir=FIXTURES_DIR, delay=0.0, rate_limit=0, error_rate=0.0, status=None):
+    """Start the stub on a background thread. Port 0 picks a free port; read it back from server.base_url."""
+    server = StubScreenerServer(port, fixtures_dir, delay, rate_limit, error_rate, status)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve saved screener.in pages from fixtures/')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before each response')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second before answering 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--status', type=int, help='answer every request with this status code')
+    args = parser.parse_args()
+
+    server = StubScreenerServer(args.port, delay=args.delay, rate_limit=args.rate_limit, error_rate=args.error_rate,
+                                status=args.status)
+    print(f'Serving {FIXTURES_DIR} at {server.base_url}')
+    server.serve_forever()
@@ -0,0 +1,111 @@
+"""
+Symbol directory for the symbol picker, and a prefetcher that keeps the most-viewed symbols warm.
+
+The directory is read from a CSV whose first two columns are the symbol and the company name, such as NSE's
+EQUITY_L.csv (REVERSEDCF_SYMBOLS_FILE, defaulting to the short list in symbols.csv). Lookups go through a
+sorted prefix index of symbols and name words, so each keystroke in the picker is a couple of bisections.
+"""
+import bisect
+import csv
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+import metrics
+from cache import QUOTE_TTL
+from fundamentals_store import get_fundamentals, get_growth_rates
+
+SYMBOLS_FILE = os.environ.get('REVERSEDCF_SYMBOLS_FILE',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.csv'))
+PREFETCH_TOP = int(os.environ.get('REVERSEDCF_PREFETCH_TOP', 20))  # Most-viewed symbols kept warm, 0 to disable
+PREFETCH_INTERVAL = float(os.environ.get('REVERSEDCF_PREFETCH_INTERVAL', 240))  # Seconds between rounds
+SKIP_WORDS = {'LIMITED', 'LTD', 'LTD.', 'AND', 'OF', 'THE', '&'}  # Name words too common to search by
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolDirectory:
+    def __init__(self, entries):
+        self.names = dict(entries)  # symbol -> company name
+        self.symbol_keys = sorted(self.names)
+        self.word_keys = sorted({(word, symbol) for symbol, name in self.names.items()
+                                 for word in name.upper().split() if word not in SKIP_WORDS})
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f))
+        return cls((row[0].strip().upper(), row[1].strip()) for row in rows[1:] if len(row) >= 2 and row[0].strip())
+
+    def search(self, text, limit=10):
+        """(symbol, name) pairs: symbols starting with text first, then companies with a name word starting with it."""
+        prefix = text.strip().upper()
+        if not prefix:
+            return []
+
+        matches = []
+        i = bisect.bisect_left(self.symbol_keys, prefix)
+        while i < len(self.symbol_keys) and self.symbol_keys[i].startswith(prefix) and len(matches) < limit:
+            matches.append(self.symbol_keys[i])
+            i += 1
+
+        i = bisect.bisect_left(self.word_keys, (prefix, ''))
+        while i < len(self.word_keys) and self.word_keys[i][0].startswith(prefix) and len(matches) < limit:
+            if self.word_keys[i][1] not in matches:
+                matches.append(self.word_keys[i][1])
+            i += 1
+        return [(symbol, self.names[symbol]) for symbol in matches]
+
+
+def load_directory(path=SYMBOLS_FILE):
+    try:
+        return SymbolDirectory.from_file(path)
+    except OSError:
+        logger.warning("No symbol directory at %s; the symbol picker will only offer what is typed", path)
+        return SymbolDirectory([])
+
+
+directory = load_directory()
+
+views = Counter()  # Symbols loaded by this worker, for the prefetcher
+views_lock = threading.Lock()
+prefetches = metrics.Counter('reversedcf_prefetches_total', 'Most-viewed symbols warmed in the background',
+                             labels=('result',))
+
+
+def record_view(symbol):
+    with views_lock:
+        views[symbol] += 1
+
+
+def most_viewed(n):
+    with views_lock:
+        return [symbol for symbol, _ in views.most_common(n)]
+
+
+def prefetch(symbols, interval=PREFETCH_INTERVAL):
+    # Quotes that would pass QUOTE_TTL before the next round are reloaded now, so a view never waits on one
+    max_age = max(QUOTE_TTL - interval, 0)
+    for symbol in symbols:
+        try:
+            get_fundamentals(symbol, max_age)  # The snapshot cache reloads in the background
+            get_growth_rates(symbol)
+            prefetches.inc(result='ok')
+        except Exception:
+            prefetches.inc(result='error')
+            logger.warning("Prefetching %s failed", symbol, exc_info=True)
+
+
+def start_prefetcher(top=PREFETCH_TOP, interval=PREFETCH_INTERVAL):
+    """Every interval seconds, warm the store and snapshot cache for the top most-viewed symbols."""
+    if top <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            prefetch(most_viewed(top), interval)
+
+    threading.Thread(target=run, daemon=True, name='prefetcher').start()
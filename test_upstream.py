@@ -0,0 +1,96 @@
+"""
+Rate limiter, retries and circuit breaker against a misbehaving stub_server.py:
+
+    python -m unittest test_upstream
+"""
+import time
+import unittest
+
+import scraper
+from stub_server import start_stub_server
+from upstream import CircuitBreaker, TokenBucket
+
+RESET_TIMEOUT = 0.2
+
+
+class UpstreamProtectionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+
+    def setUp(self):
+        # A fresh breaker and limiter per test, no retries so each fetch() is one request
+        self.saved = scraper.breaker, scraper.rate_limiter, scraper.MAX_RETRIES
+        scraper.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=RESET_TIMEOUT)
+        scraper.rate_limiter = TokenBucket(0, 1)
+        scraper.MAX_RETRIES = 0
+        self.stub.status = None
+        self.stub.rate_limit = 0
+        self.stub.requests.clear()
+        self.url = f'{self.stub.base_url}/company/NESTLEIND/consolidated/'
+
+    def tearDown(self):
+        scraper.breaker, scraper.rate_limiter, scraper.MAX_RETRIES = self.saved
+
+    def open_breaker(self):
+        self.stub.status = 503
+        for _ in range(3):
+            scraper.fetch(self.url)
+        self.assertEqual(scraper.breaker.state, CircuitBreaker.OPEN)
+
+    def test_open_breaker_fails_fast(self):
+        self.open_breaker()
+        self.stub.requests.clear()
+        self.assertIsNone(scraper.fetch(self.url))
+        self.assertEqual(self.stub.requests, [])
+
+    def test_rate_limited_trial_closes_the_breaker(self):
+        self.open_breaker()
+        time.sleep(RESET_TIMEOUT)
+        self.stub.status = 429
+        self.assertEqual(scraper.fetch(self.url).status_code, 429)  # The half-open trial is throttled
+
+        self.stub.status = None
+        response = scraper.fetch(self.url)
+        self.assertIsNotNone(response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(scraper.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens_the_breaker(self):
+        self.open_breaker()
+        time.sleep(RESET_TIMEOUT)
+        scraper.fetch(self.url)
+        self.assertEqual(scraper.breaker.state, CircuitBreaker.OPEN)
+
+        self.stub.status = None
+        time.sleep(RESET_TIMEOUT)
+        self.assertEqual(scraper.fetch(self.url).status_code, 200)
+        self.assertEqual(scraper.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rate_limit_slows_down_without_opening_the_breaker(self):
+        scraper.rate_limiter = TokenBucket(100, 100)
+        self.stub.rate_limit = 2
+        statuses = [scraper.fetch(self.url).status_code for _ in range(5)]
+        self.assertIn(429, statuses)
+        self.assertEqual(scraper.breaker.state, CircuitBreaker.CLOSED)
+        self.assertLess(scraper.rate_limiter.rate, 100)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_abandoned_trial_times_out(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+        breaker.record_failure()
+        time.sleep(RESET_TIMEOUT)
+        self.assertTrue(breaker.allow())  # The trial, which never reports back
+        self.assertFalse(breaker.allow())
+        time.sleep(RESET_TIMEOUT)
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Protection for screener.in under load: a token bucket that paces outgoing requests, jittered exponential
+backoff when it answers 429 or 5xx, and a circuit breaker that fails fast while it keeps failing so the app
+serves cached snapshots instead of piling on more requests.
+"""
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average with bursts of up to burst. Callers that find the bucket empty
+    reserve the next token and sleep until it's due, so waiting threads are served in arrival order.
+
+    The rate adapts to the upstream: slow_down() halves it after a 429 (once a second at most, since requests
+    sent together tend to be throttled together) and every recover() wins back a twentieth of the configured
+    rate, so a throttled worker backs off quickly and returns to full speed slowly.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate  # 0 turns the limit off
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.burst = burst
+        self.slowed_at = 0.0
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0  # Total seconds callers have slept, for metrics
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.max_rate > 0 and now - self.slowed_at >= 1.0:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.slowed_at = now
+
+    def recover(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """
+    Closed: requests go through. After failure_threshold failures in a row (5xx responses or connection
+    errors; a 429 only means "slow down" and is left to the rate limiter) it opens and rejects every request
+    for reset_timeout seconds, then lets a single trial request through (half open). The trial's outcome
+    closes it again or re-opens it for another reset_timeout. A trial that reports neither within
+    reset_timeout is given up on, and the next request becomes the trial.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.trial_started_at = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'opened': 0, 'rejected': 0}
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.trial_running and now - self.trial_started_at >= self.reset_timeout:
+                self.trial_running = False  # The trial never reported back
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self.trial_running):
+                self.stats['rejected'] += 1
+                return False
+            if self.state == self.HALF_OPEN:
+                self.trial_running = True
+                self.trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and
+                                                self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.stats['opened'] += 1
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=8.0):
+    """
+    Seconds to wait before retry number attempt + 1: "full jitter", uniform over [0, base * 2**attempt],
+    so workers that failed together don't retry together. A Retry-After in seconds is honoured, up to cap.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None and retry_after.strip().isdigit():
+        delay = max(delay, min(cap, float(retry_after)))
+    return delay
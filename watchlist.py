@@ -0,0 +1,200 @@
+"""
+Value a whole watchlist of symbols with one set of DCF parameters.
+
+    python watchlist.py symbols.txt --out valuations.csv --coc 10 --roce 30
+
+Symbols are scraped with bounded parallelism and each row is written as soon as its symbol finishes, so a
+long run can be watched (or interrupted) part way. A failing symbol only produces an error row.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import QUOTE_TTL
+from files import JOBS_DIR, job_dir, write_json
+from pe_table import lookup_intrinsic_value
+from reverse_dcf import market_pe, implied_growth
+from scraper import get_snapshot, scrape_market_cap_and_pe, scrape_roce_median, snapshot_cache
+
+# Slider defaults from app.layout
+DEFAULT_PARAMS = {'coc': 10, 'roce': 30, 'growth': 12, 'high_growth_period': 10, 'fade_period': 5,
+                  'terminal_growth': 2}
+COLUMNS = ['Symbol', 'Market Cap', 'Stock P/E', 'FY23 P/E', 'ROCE Median', 'Intrinsic PE', 'Overvaluation %',
+           'Implied Growth %', 'Error']
+NUMERIC_COLUMNS = COLUMNS[1:-1]
+
+
+def parse_symbols(text):
+    # Comma, space or newline separated; upper-cased with duplicates dropped, keeping the first position
+    symbols = [symbol.upper() for symbol in re.split(r'[\s,;]+', text or '') if symbol]
+    return list(dict.fromkeys(symbols))
+
+
+def value_symbol(symbol, params):
+    row = dict.fromkeys(COLUMNS, None)
+    row['Symbol'] = symbol
+    try:
+        snapshot = get_snapshot(symbol, QUOTE_TTL)
+        scrap = scrape_market_cap_and_pe(symbol, snapshot)
+        if scrap is None:
+            raise ValueError("Invalid scraping result")
+        roce_data = scrape_roce_median(symbol, snapshot)
+        if roce_data is None:
+            raise ValueError("Invalid ROCE scraping result")
+
+        # A roce of None means "use the company's own 5-yr median"
+        roce = params['roce'] if params['roce'] is not None else roce_data
+        intrinsic_pe, overeval = lookup_intrinsic_value(roce, params['coc'], params['growth'],
+                                                        params['high_growth_period'], params['fade_period'],
+                                                        params['terminal_growth'], scrap)
+
+        growth_needed = implied_growth(market_pe(scrap), roce, params['coc'], params['high_growth_period'],
+                                       params['fade_period'], params['terminal_growth'])
+
+        row.update({'Market Cap': scrap['Market Cap'], 'Stock P/E': scrap['Stock P/E'],
+                    'FY23 P/E': scrap['FY23 P/E'], 'ROCE Median': roce_data,
+                    'Intrinsic PE': round(intrinsic_pe, 2), 'Overvaluation %': round(overeval * 100),
+                    'Implied Growth %': round(growth_needed, 2) if growth_needed is not None else None})
+    except Exception as e:
+        row['Error'] = str(e) or type(e).__name__
+    return row
+
+
+class WatchlistStats:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failures = 0
+        self.started = time.perf_counter()
+        self.cache_before = snapshot_cache.info()
+
+    def record(self, row):
+        self.done += 1
+        self.failures += row['Error'] is not None
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        cache_now = snapshot_cache.info()
+        return {'total': self.total, 'done': self.done, 'failures': self.failures,
+                'elapsed_seconds': round(elapsed, 2),
+                'symbols_per_second': round(self.done / elapsed, 2) if elapsed else 0.0,
+                'cache_hits': sum(cache_now[key] - self.cache_before[key] for key in ('hits', 'stale')),
+                'cache_misses': cache_now['misses'] - self.cache_before['misses']}
+
+
+def value_watchlist(symbols, params, max_workers=8):
+    """Yield one row per symbol, in completion order."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(value_symbol, symbol, params) for symbol in symbols]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_watchlist(symbols, params, csv_path, parquet_path=None, max_workers=8, on_row=None):
+    stats = WatchlistStats(len(symbols))
+    rows = []
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in value_watchlist(symbols, params, max_workers):
+            writer.writerow(row)
+            f.flush()  # Readers see each row as soon as it is valued
+            rows.append(row)
+            stats.record(row)
+            if on_row:
+                on_row(row, stats)
+
+    if parquet_path:
+        write_parquet(rows, parquet_path)
+    return stats
+
+
+def write_parquet(rows, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow")
+    pq.write_table(pa.Table.from_pylist(rows), path)
+
+
+def start_watchlist_job(symbols, params, max_workers=8):
+    """
+    Run a watchlist in a background thread. Rows stream into <job>.csv and stats into <job>.json under JOBS_DIR,
+    so any gunicorn worker on this host can serve the progress.
+    """
+    job_dir()  # Also clears out old jobs
+    job_id = uuid.uuid4().hex
+    csv_path, stats_path = job_paths(job_id)
+
+    def write_stats(stats, finished=False):
+        write_json(stats_path, {**stats.as_dict(), 'finished': finished})
+
+    def run():
+        stats = run_watchlist(symbols, params, csv_path, max_workers=max_workers,
+                              on_row=lambda row, stats: write_stats(stats))
+        write_stats(stats, finished=True)
+
+    write_stats(WatchlistStats(len(symbols)))
+    threading.Thread(target=run, daemon=True).start()
+    return job_id
+
+
+def job_paths(job_id):
+    return os.path.join(JOBS_DIR, f'{job_id}.csv'), os.path.join(JOBS_DIR, f'{job_id}.json')
+
+
+def read_watchlist_job(job_id):
+    csv_path, stats_path = job_paths(job_id)
+    with open(stats_path) as f:
+        stats = json.load(f)
+    rows = []
+    if os.path.exists(csv_path):
+        with open(csv_path, newline='') as f:
+            rows = [row for row in csv.DictReader(f)]
+
+    # CSV gives back strings; convert so the table sorts numerically
+    for row in rows:
+        for column in NUMERIC_COLUMNS:
+            row[column] = float(row[column]) if row[column] else None
+        row['Error'] = row['Error'] or None
+    return rows, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Value a watchlist of NSE/BSE symbols')
+    parser.add_argument('symbols', help='file with symbols, comma or newline separated')
+    parser.add_argument('--out', default='valuations.csv', help='CSV file, written row by row')
+    parser.add_argument('--parquet', help='also write the results to this Parquet file (needs pyarrow)')
+    parser.add_argument('--workers', type=int, default=8, help='symbols valued in parallel')
+    parser.add_argument('--coc', type=float, default=DEFAULT_PARAMS['coc'])
+    parser.add_argument('--roce', default=DEFAULT_PARAMS['roce'],
+                        help="RoCE for the DCF, or 'median' to use each company's 5-yr median")
+    parser.add_argument('--growth', type=float, default=DEFAULT_PARAMS['growth'])
+    parser.add_argument('--high-growth-period', type=int, default=DEFAULT_PARAMS['high_growth_period'])
+    parser.add_argument('--fade-period', type=int, default=DEFAULT_PARAMS['fade_period'])
+    parser.add_argument('--terminal-growth', type=float, default=DEFAULT_PARAMS['terminal_growth'])
+    args = parser.parse_args()
+
+    with open(args.symbols) as f:
+        symbols = parse_symbols(f.read())
+    params = {'coc': args.coc, 'roce': None if args.roce == 'median' else float(args.roce),
+              'growth': args.growth, 'high_growth_period': args.high_growth_period,
+              'fade_period': args.fade_period, 'terminal_growth': args.terminal_growth}
+
+    def progress(row, stats):
+        status = row['Error'] or f"intrinsic PE {row['Intrinsic PE']}, overvaluation {row['Overvaluation %']}%"
+        print(f"[{stats.done}/{stats.total}] {row['Symbol']}: {status}")
+
+    stats = run_watchlist(symbols, params, args.out, args.parquet, args.workers, on_row=progress)
+    print(json.dumps(stats.as_dict()))
+
+
+if __name__ == '__main__':
+    main()